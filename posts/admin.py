@@ -1,13 +1,112 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections, transaction
+from django.utils.functional import cached_property
 
 from .models import Comment, Group, Post
+from .search import filter_matching
 
+# Unfiltered changelists of tables bigger than this show an estimate
+ESTIMATE_ABOVE = 100_000
 
-class PostAdmin(admin.ModelAdmin):
+BATCH_SIZE = 1000
+
+
+def parse_estimate(value):
+    """Row count from a statistics value, None for a missing or negative one
+
+    pg_class.reltuples is a float, -1 for a table never analyzed (since
+    PostgreSQL 14); sqlite_stat1.stat is a string of numbers.
+    """
+    if value is None:
+        return None
+    try:
+        rows = int(float(str(value).split()[0]))
+    except (IndexError, ValueError):
+        return None
+    return rows if rows >= 0 else None
+
+
+def estimated_rows(queryset):
+    """Row count of the table from planner statistics, None if unknown"""
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    queries = {
+        "postgresql": "SELECT reltuples FROM pg_class WHERE relname = %s",
+        # Filled by ANALYZE, the first number is the row count
+        "sqlite": "SELECT stat FROM sqlite_stat1 WHERE tbl = %s",
+    }
+    if connection.vendor not in queries:
+        return None
+    try:
+        with transaction.atomic(using=queryset.db):
+            with connection.cursor() as cursor:
+                cursor.execute(queries[connection.vendor], [table])
+                row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    return parse_estimate(row[0]) if row else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Avoid COUNT(*) over the whole of a huge table"""
+
+    @cached_property
+    def count(self):
+        if not self.object_list.query.where:
+            estimate = estimated_rows(self.object_list)
+            if estimate is not None and estimate > ESTIMATE_ABOVE:
+                return estimate
+        return self.object_list.count()
+
+
+class BatchedActionsMixin:
+    """Bulk actions that work through the selection in small batches"""
+    actions = ["delete_in_batches"]
+
+    def in_batches(self, queryset):
+        ids = list(queryset.values_list("pk", flat=True))
+        for start in range(0, len(ids), BATCH_SIZE):
+            with transaction.atomic():
+                yield self.model.objects.filter(
+                    pk__in=ids[start:start + BATCH_SIZE])
+
+    def delete_in_batches(self, request, queryset):
+        deleted = 0
+        for batch in self.in_batches(queryset):
+            deleted += batch.delete()[1].get(self.model._meta.label, 0)
+        self.message_user(request, f"Удалено: {deleted}")
+    delete_in_batches.short_description = "Удалить выбранные (по частям)"
+    delete_in_batches.allowed_permissions = ("delete",)
+
+
+class PostAdmin(BatchedActionsMixin, admin.ModelAdmin):
     list_display = ("pk", "text", "pub_date", "author", "group",)
+    list_select_related = ("author", "group")
     search_fields = ("text", )
     list_filter = ("pub_date", )
+    date_hierarchy = "pub_date"
+    raw_id_fields = ("author", )
+    autocomplete_fields = ("group", )
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     empty_value_display = "-пусто-"
+    actions = BatchedActionsMixin.actions + ["requeue_thumbnails"]
+
+    def get_search_results(self, request, queryset, search_term):
+        """Search through the full-text index instead of LIKE scans"""
+        matches = filter_matching(queryset, search_term)
+        if matches is None:
+            return super().get_search_results(
+                request, queryset, search_term)
+        return matches, False
+
+    def requeue_thumbnails(self, request, queryset):
+        for batch in self.in_batches(queryset):
+            batch.update(thumbnails_ready=False)
+        self.message_user(request, "Миниатюры будут созданы заново")
+    requeue_thumbnails.short_description = "Пересоздать миниатюры"
+    requeue_thumbnails.allowed_permissions = ("change",)
 
 
 class GroupAdmin(admin.ModelAdmin):
@@ -15,11 +114,16 @@ class GroupAdmin(admin.ModelAdmin):
     prepopulated_fields = {"slug": ("title", )}
 
 
-class CommentAdmin(admin.ModelAdmin):
-    list_display = ("text", "pub_date", "author",)
-    search_fields = ("text", "author",)
+class CommentAdmin(BatchedActionsMixin, admin.ModelAdmin):
+    list_display = ("text", "created", "author", "post",)
+    list_select_related = ("author", "post__author", "post__group")
+    search_fields = ("text", )
+    date_hierarchy = "created"
+    raw_id_fields = ("author", "post")
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group, GroupAdmin)
-admin.site.register(Comment)
+admin.site.register(Comment, CommentAdmin)
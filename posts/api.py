@@ -0,0 +1,258 @@
+"""JSON API over the feeds, posts, comments and follows.
+
+Rows are read with values() projections rather than model instances and
+paginated with CursorPaginator. ?fields= picks the keys to return. Feed
+responses carry an ETag derived from the page cache scope versions, so a
+repeated request is answered with 304 before any query for the posts.
+
+Browsers are authenticated by their session and, for writes, the CSRF
+token as usual. Other clients send "Authorization: Token <key>" with a
+key from manage.py create_api_token; such requests skip the CSRF check,
+as a page on another site cannot add the header.
+"""
+import hashlib
+import json
+import secrets
+from functools import wraps
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.http import Http404, JsonResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.shortcuts import get_object_or_404
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import (condition, conditional_page,
+                                          require_http_methods)
+
+from .forms import CommentForm
+from .models import ApiToken, Comment, Follow, Group, Post, User
+from .page_cache import ALL, digest, get_versions
+from .paginator import POSTS_PER_PAGE, CursorPaginator
+from .timeline import timeline_posts
+
+# Public name of each key and the lookup it is read with
+POST_FIELDS = {
+    "id": "id",
+    "text": "text",
+    "pub_date": "pub_date",
+    "author": "author__username",
+    "group": "group__slug",
+    "image": "image",
+    "comment_count": "comment_count",
+}
+
+COMMENT_FIELDS = {
+    "id": "id",
+    "post": "post_id",
+    "author": "author__username",
+    "text": "text",
+    "created": "created",
+}
+
+
+class ApiError(Exception):
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def error(message, status):
+    return JsonResponse({"error": message}, status=status)
+
+
+def token_digest(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def issue_token(user):
+    """Create an API key for the user and return it"""
+    key = secrets.token_urlsafe(30)
+    ApiToken.objects.create(user=user, digest=token_digest(key))
+    return key
+
+
+def authenticate(request):
+    """Take the user from a token, or check CSRF for a session write"""
+    scheme, _, key = request.META.get("HTTP_AUTHORIZATION", "").partition(
+        " ")
+    if scheme == "Token":
+        token = ApiToken.objects.select_related("user").filter(
+            digest=token_digest(key.strip())).first()
+        if token is None or not token.user.is_active:
+            raise ApiError("Неверный ключ", 401)
+        request.user = token.user
+    elif CsrfViewMiddleware().process_view(request, None, (), {}):
+        raise ApiError("Ошибка проверки CSRF", 403)
+
+
+def api_view(view):
+    """Report errors as JSON instead of HTML pages or login redirects"""
+    @csrf_exempt
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            authenticate(request)
+            return view(request, *args, **kwargs)
+        except Http404:
+            return error("Не найдено", 404)
+        except ApiError as problem:
+            return error(str(problem), problem.status)
+    return wrapper
+
+
+def login_required(view):
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            raise ApiError("Требуется вход", 401)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def selected_fields(request, columns):
+    if "fields" not in request.GET:
+        return list(columns)
+    fields = [name for name in request.GET["fields"].split(",") if name]
+    unknown = set(fields) - set(columns)
+    if unknown:
+        raise ApiError(f"Неизвестные поля: {', '.join(sorted(unknown))}")
+    return fields
+
+
+def serialize(row, columns, fields):
+    item = {name: row[columns[name]] for name in fields}
+    if item.get("image"):
+        item["image"] = settings.MEDIA_URL + item["image"]
+    return item
+
+
+def listing(request, queryset, columns):
+    """A page of the queryset projected to the requested fields"""
+    fields = selected_fields(request, columns)
+    paginator = CursorPaginator(
+        queryset.values(*columns.values()), POSTS_PER_PAGE)
+    page = paginator.get_page(request.GET.get("cursor"))
+    return JsonResponse({
+        "results": [serialize(row, columns, fields) for row in page],
+        "next": page.next_cursor,
+        "previous": page.previous_cursor,
+    }, encoder=DjangoJSONEncoder)
+
+
+def scope_etag(*scopes):
+    """ETag changing whenever the cached pages of the scopes would"""
+    def etag(request, **kwargs):
+        names = [ALL] + [scope.format(**kwargs) for scope in scopes]
+        return digest(request.get_full_path(), *get_versions(names))
+    return etag
+
+
+def post_etag(request, post_id):
+    version = Post.objects.filter(pk=post_id).values_list(
+        "version", flat=True).first()
+    return digest(request.get_full_path(), version) if version else None
+
+
+@api_view
+@require_http_methods(["GET", "HEAD"])
+@condition(etag_func=scope_etag("index"))
+def posts(request):
+    return listing(request, Post.objects.all(), POST_FIELDS)
+
+
+@api_view
+@require_http_methods(["GET", "HEAD"])
+@condition(etag_func=scope_etag("group:{slug}"))
+def group_posts(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return listing(request, group.posts.all(), POST_FIELDS)
+
+
+@api_view
+@require_http_methods(["GET", "HEAD"])
+@condition(etag_func=scope_etag("profile:{username}"))
+def profile_posts(request, username):
+    author = get_object_or_404(User, username=username)
+    return listing(request, author.posts.all(), POST_FIELDS)
+
+
+@api_view
+@require_http_methods(["GET", "HEAD"])
+@login_required
+@conditional_page
+def follow_posts(request):
+    return listing(request, timeline_posts(request.user), POST_FIELDS)
+
+
+@api_view
+@require_http_methods(["GET", "HEAD"])
+@condition(etag_func=post_etag)
+def post_detail(request, post_id):
+    fields = selected_fields(request, POST_FIELDS)
+    row = Post.objects.filter(pk=post_id).values(
+        *POST_FIELDS.values()).first()
+    if row is None:
+        raise Http404
+    return JsonResponse(
+        serialize(row, POST_FIELDS, fields), encoder=DjangoJSONEncoder)
+
+
+@api_view
+@require_http_methods(["GET", "HEAD", "POST"])
+def comments(request, post_id):
+    if request.method == "POST":
+        return add_comment(request, post_id)
+    return comment_list(request, post_id)
+
+
+@condition(etag_func=post_etag)
+def comment_list(request, post_id):
+    post = get_object_or_404(Post, pk=post_id)
+    return listing(request, post.comments.all(), COMMENT_FIELDS)
+
+
+@login_required
+@transaction.atomic
+def add_comment(request, post_id):
+    post = get_object_or_404(Post, pk=post_id)
+    if request.content_type == "application/json":
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            raise ApiError("Некорректный JSON")
+        if not isinstance(data, dict):
+            raise ApiError("Некорректный JSON")
+    else:
+        data = request.POST
+    form = CommentForm(data)
+    if not form.is_valid():
+        return JsonResponse({"errors": form.errors.get_json_data()},
+                            status=400)
+    comment = form.save(commit=False)
+    comment.author = request.user
+    comment.post = post
+    comment.save()
+    row = Comment.objects.filter(pk=comment.pk).values(
+        *COMMENT_FIELDS.values()).get()
+    return JsonResponse(
+        serialize(row, COMMENT_FIELDS, list(COMMENT_FIELDS)),
+        status=201, encoder=DjangoJSONEncoder)
+
+
+@api_view
+@require_http_methods(["POST", "DELETE"])
+@login_required
+@transaction.atomic
+def follow(request, username):
+    author = get_object_or_404(User, username=username)
+    if author == request.user:
+        raise ApiError("Нельзя подписаться на себя")
+    if request.method == "POST":
+        _, created = Follow.objects.get_or_create(
+            user=request.user, author=author)
+        return JsonResponse({"following": True}, status=201 if created
+                            else 200)
+    Follow.objects.filter(user=request.user, author=author).delete()
+    return JsonResponse({"following": False})
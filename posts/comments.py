@@ -0,0 +1,68 @@
+"""Windows of comments shown under posts.
+
+A post page shows its newest COMMENTS_PER_PAGE comments, the index the
+newest FEED_COMMENTS of every post on the page. The rest is loaded page
+by page with the same cursors as the feeds, newest first.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from .models import Comment
+from .paginator import NEXT, CursorPaginator
+
+
+def paginator(post):
+    return CursorPaginator(
+        post.comments.select_related("author"), settings.COMMENTS_PER_PAGE)
+
+
+def next_cursor(post, shown):
+    """Cursor to the comments after those shown, None if there are none"""
+    if not shown or post.comment_count <= len(shown):
+        return None
+    return paginator(post).encode(NEXT, shown[len(shown) - 1])
+
+
+def first_page(post):
+    """Return the newest comments as a QuerySet and the cursor past them"""
+    # The id breaks ties the same way as the cursor and latest() do
+    comments = post.comments.select_related("author").order_by(
+        "-created", "-id")[:settings.COMMENTS_PER_PAGE]
+    return comments, next_cursor(post, comments)
+
+
+def latest(post_ids, limit):
+    """The newest comments of each post, numbered by ROW_NUMBER() in SQL"""
+    ranked = Comment.objects.filter(post_id__in=post_ids).annotate(
+        position=Window(
+            RowNumber(),
+            partition_by=[F("post_id")],
+            order_by=[F("created").desc(), F("id").desc()],
+        ),
+    ).order_by().values("id", "position")
+    sql, params = ranked.query.sql_with_params()
+    # Django 2.2 can neither filter on a window nor pass a raw subquery to
+    # __in without wrapping it in a second pair of parentheses
+    table = connection.ops.quote_name(Comment._meta.db_table)
+    return Comment.objects.extra(
+        where=[f'{table}."id" IN (SELECT "id" FROM ({sql}) ranked '
+               f'WHERE "position" <= %s)'],
+        params=[*params, limit],
+    ).select_related("author")
+
+
+def attach_latest(posts, limit=None):
+    """Set latest_comments and comments_cursor on every post"""
+    limit = limit or settings.FEED_COMMENTS
+    posts = list(posts)
+    by_post = defaultdict(list)
+    if posts:
+        for comment in latest([post.pk for post in posts], limit):
+            by_post[comment.post_id].append(comment)
+    for post in posts:
+        post.latest_comments = by_post[post.pk]
+        post.comments_cursor = next_cursor(post, post.latest_comments)
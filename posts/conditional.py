@@ -0,0 +1,150 @@
+"""HTTP conditional GET for the post, profile and group pages.
+
+Each page has a last-modified stamp that is cheap to read: the group's
+and the author's stamps are moved forward by signals on every write the
+page shows, a post page also looks at its version and newest comment.
+The ETag mixes the stamp with the URL and the viewer, so that a browser
+or a proxy holding a copy gets a bodiless 304 without the page being
+rendered or even looked up in the page cache.
+"""
+from functools import wraps
+
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+from . import write_behind
+from .models import AuthorStats, Group, Post
+from .page_cache import digest
+
+
+def variant(request):
+    """Part of the ETag that tells apart what different viewers see"""
+    if not request.user.is_authenticated:
+        return "anonymous"
+    csrf = request.COOKIES.get(settings.CSRF_COOKIE_NAME, "")
+    return f"user:{request.user.pk}:{csrf}"
+
+
+def touch_groups(*group_ids):
+    group_ids = set(group_ids) - {None}
+    if group_ids:
+        Group.objects.filter(pk__in=group_ids).update(
+            last_modified=timezone.now())
+
+
+def touch_post_pages(post, created=False):
+    """Mark the pages listing the post as changed"""
+    if not created:
+        # A new post already moved the stamp when its counter was bumped
+        AuthorStats.objects.touch(post.author_id)
+    touch_groups(post.group_id, getattr(post, "loaded_group_id", None))
+
+
+def touch_comment_pages(post_id):
+    now = timezone.now()
+    AuthorStats.objects.filter(user__posts=post_id).update(last_modified=now)
+    Group.objects.filter(posts=post_id).update(last_modified=now)
+
+
+def touch_author_pages(user):
+    """The author's name is shown on the profile and on group pages"""
+    now = timezone.now()
+    AuthorStats.objects.filter(user=user).update(last_modified=now)
+    Group.objects.filter(posts__author=user).update(last_modified=now)
+
+
+def touch_group_authors(group):
+    """The group's title is shown on its posts in the authors' profiles"""
+    AuthorStats.objects.filter(user__posts__group=group).update(
+        last_modified=timezone.now())
+
+
+def post_validators(request, username, post_id):
+    row = Post.objects.filter(pk=post_id).values(
+        "author__username",
+        "version",
+        "pub_date",
+        "comment_count",
+        "author__stats__last_modified",
+    ).annotate(
+        last_comment=Max("comments__created"),
+    ).order_by("pk").first()
+    if row is None or row["author__username"] != username:
+        return None
+    stamps = [
+        row["pub_date"],
+        row["last_comment"],
+        row["author__stats__last_modified"],
+    ]
+    return (
+        max(stamp for stamp in stamps if stamp is not None),
+        row["version"],
+        row["comment_count"],
+    )
+
+
+def profile_validators(request, username):
+    stamp = AuthorStats.objects.filter(
+        user__username=username).values_list(
+        "last_modified", flat=True).first()
+    return stamp and (stamp,)
+
+
+def group_validators(request, slug):
+    stamp = Group.objects.filter(slug=slug).values_list(
+        "last_modified", flat=True).first()
+    return stamp and (stamp,)
+
+
+def conditional(validators):
+    """Answer the view with 304 while its validators are unchanged.
+
+    validators(request, **kwargs) returns a tuple starting with the page's
+    last-modified time, or None to let the view run (and likely 404).
+    """
+    def get_validators(request, *args, **kwargs):
+        # condition() asks for the ETag and Last-Modified separately
+        if not hasattr(request, "page_validators"):
+            request.page_validators = validators(request, *args, **kwargs)
+        return request.page_validators
+
+    def etag(request, *args, **kwargs):
+        values = get_validators(request, *args, **kwargs)
+        if values is None:
+            return None
+        # The viewer's queued writes are shown to them but move no stamp
+        queued = [entry["queued"] for entry in write_behind.pending(request)]
+        return digest(
+            *values, request.get_full_path(), variant(request), *queued)
+
+    def last_modified(request, *args, **kwargs):
+        values = get_validators(request, *args, **kwargs)
+        if write_behind.pending(request):
+            return None
+        return values and values[0]
+
+    def decorator(view):
+        conditional_view = condition(etag, last_modified)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            patch_vary_headers(response, ("Cookie",))
+            found = getattr(request, "page_validators", None) is not None
+            if request.user.is_authenticated:
+                patch_cache_control(response, private=True, no_cache=True)
+            elif found and response.status_code in (200, 304):
+                # A 304 carries the headers of the 200 it revalidates; a
+                # 404 must not be shared, the page may be created any time
+                patch_cache_control(
+                    response,
+                    public=True,
+                    max_age=0,
+                    s_maxage=settings.CONDITIONAL_SHARED_MAX_AGE,
+                )
+            return response
+        return wrapper
+    return decorator
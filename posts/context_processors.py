@@ -1,12 +1,24 @@
 from django.contrib.auth.models import User
+from django.utils.functional import SimpleLazyObject
 
 
 def author(request):
-    """Return current author's name (if present) or username"""
-    nick = request.resolver_match.kwargs.get("username", "")
-    if nick:
-        username = User.objects.get(username=nick)
-        author_name = username.get_full_name() or nick
-    else:
-        author_name = ""
-    return {"author_name": author_name}
+    """Return current author's name (if present) or username.
+
+    The name is only looked up if a template renders it, and the user
+    already fetched by the view (request.url_author) is reused.
+    """
+    match = request.resolver_match
+    nick = match.kwargs.get("username", "") if match else ""
+
+    def author_name():
+        if not nick:
+            return ""
+        user = getattr(request, "url_author", None)
+        if user is None or user.username != nick:
+            user = User.objects.filter(username=nick).first()
+        if user is None:
+            return nick
+        return user.get_full_name() or nick
+
+    return {"author_name": SimpleLazyObject(author_name)}
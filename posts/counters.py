@@ -0,0 +1,65 @@
+"""Maintenance of denormalized counters.
+
+Post.comment_count and AuthorStats are kept up to date by signals in the
+same transaction as the row that changed. reconcile() recomputes them
+from scratch for the rare cases that bypass signals (bulk operations,
+raw SQL, crashes between statements).
+"""
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import AuthorStats, Comment, Follow, Post, User
+
+BATCH_SIZE = 1000
+
+
+def bump_comments(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comment_count=Greatest(F("comment_count") + delta, 0),
+        version=F("version") + 1,
+    )
+
+
+def count_of(model, field):
+    """Correlated subquery counting model rows whose field is the outer pk"""
+    rows = model.objects.filter(**{field: OuterRef("pk")}).order_by()
+    return Coalesce(Subquery(
+        rows.values(field).annotate(n=Count("pk")).values("n")), 0)
+
+
+def repair(queryset, **counters):
+    """Recompute counters on rows where they drifted; return rows fixed"""
+    drifted = queryset.annotate(**{
+        f"actual_{field}": expression
+        for field, expression in counters.items()
+    })
+    mismatch = Q()
+    for field in counters:
+        mismatch |= ~Q(**{field: F(f"actual_{field}")})
+    ids = list(drifted.filter(mismatch).values_list("pk", flat=True))
+    for start in range(0, len(ids), BATCH_SIZE):
+        queryset.model.objects.filter(
+            pk__in=ids[start:start + BATCH_SIZE]).update(**counters)
+    return len(ids)
+
+
+def reconcile():
+    """Return how many posts and author stats rows had to be fixed"""
+    missing = User.objects.filter(stats__isnull=True).values_list(
+        "pk", flat=True)
+    AuthorStats.objects.bulk_create(
+        [AuthorStats(user_id=pk) for pk in missing],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    posts = repair(
+        Post.objects.all(),
+        comment_count=count_of(Comment, "post"),
+    )
+    stats = repair(
+        AuthorStats.objects.all(),
+        posts_count=count_of(Post, "author"),
+        followers_count=count_of(Follow, "author"),
+        following_count=count_of(Follow, "user"),
+    )
+    return posts, stats
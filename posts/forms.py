@@ -1,9 +1,12 @@
 from django import forms
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.core.exceptions import ValidationError
 from django.forms import ModelForm
 from django.utils.translation import gettext_lazy as _
 
+from . import uploads
 from .models import Comment, Post
 
 
@@ -19,6 +22,33 @@ class PostForm(ModelForm):
             "group": _("Выберите группу(при необходимости)"),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The upload handler kept only the head of an oversized file
+        self.image_oversized = getattr(
+            self.files.get("image"), "oversized", False)
+        if self.image_oversized:
+            self.files = self.files.copy()
+            del self.files["image"]
+
+    def clean_image(self):
+        image = self.cleaned_data["image"]
+        if self.image_oversized:
+            raise ValidationError(_(
+                "Файл слишком большой, максимум %(size)s МБ."
+            ), params={"size": settings.POST_IMAGE_MAX_BYTES // 2 ** 20})
+        if "image" not in self.files:
+            return image
+        try:
+            return uploads.sanitize(image)
+        except uploads.TooLarge:
+            raise ValidationError(_(
+                "Изображение слишком большое, максимум %(pixels)s пикселей."
+            ), params={"pixels": settings.POST_IMAGE_MAX_PIXELS})
+        except ValueError:
+            raise ValidationError(_(
+                "Поддерживаются только изображения JPEG, PNG, GIF и WebP."))
+
 
 class CommentForm(ModelForm):
     class Meta:
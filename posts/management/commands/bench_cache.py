@@ -0,0 +1,57 @@
+import multiprocessing
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+
+def run_worker(path, requests, results):
+    """Fetch the page and count responses that needed no queries"""
+    connections.close_all()
+    client = Client()
+    hits = 0
+    started = time.perf_counter()
+    for _ in range(requests):
+        with CaptureQueriesContext(connection) as queries:
+            client.get(path)
+        hits += not queries
+    results.put((hits, time.perf_counter() - started))
+
+
+class Command(BaseCommand):
+    help = ("Hit a page from several worker processes and report how "
+            "often the configured cache backend served it")
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", nargs="?", default="/")
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--requests", type=int, default=100,
+                            help="Requests per worker")
+
+    def handle(self, *args, **options):
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        connections.close_all()
+        results = multiprocessing.Queue()
+        workers = [
+            multiprocessing.Process(
+                target=run_worker,
+                args=(options["path"], options["requests"], results),
+            )
+            for _ in range(options["workers"])
+        ]
+        for worker in workers:
+            worker.start()
+        outcomes = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+        total = options["workers"] * options["requests"]
+        hits = sum(hits for hits, _ in outcomes)
+        elapsed = max(seconds for _, seconds in outcomes)
+        self.stdout.write(
+            f"{settings.CACHE_BACKEND}: {hits}/{total} cache hits "
+            f"({hits / total:.0%}), {total / elapsed:.0f} requests/s")
@@ -0,0 +1,138 @@
+import json
+import statistics
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import AuthorStats, Group, Post
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+class Command(BaseCommand):
+    help = ("Request every page of the posts app through the test client "
+            "and report latency percentiles and query counts, failing "
+            "when they exceed the given thresholds")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=50,
+                            help="Requests per endpoint")
+        parser.add_argument(
+            "--warm",
+            action="store_true",
+            help="Keep the caches between requests instead of clearing "
+                 "them, measuring cache hits rather than the database",
+        )
+        parser.add_argument(
+            "--thresholds",
+            help="JSON file of {endpoint: {\"p95_ms\": .., \"queries\": ..}}",
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.2,
+            help="Allowed relative slowdown over the latency thresholds",
+        )
+        parser.add_argument(
+            "--save",
+            help="Write the results as JSON, e.g. to use as thresholds",
+        )
+
+    def endpoints(self):
+        """Map names to (user, URL), the arguments from the busiest rows"""
+        post = Post.objects.order_by("-comment_count").first()
+        author = AuthorStats.objects.order_by("-posts_count").first()
+        reader = AuthorStats.objects.order_by("-following_count").first()
+        group = Group.objects.annotate(
+            n=Count("posts")).order_by("-n").first()
+        if not (post and author and reader and group):
+            raise CommandError("Not enough data, run generate_data first")
+        author, reader = author.user, reader.user
+        own_post = author.posts.first()
+        return {
+            "index": (reader, reverse("index")),
+            "group": (reader, reverse("group", args=[group.slug])),
+            "profile": (reader, reverse("profile", args=[author.username])),
+            "post": (reader, reverse(
+                "post", args=[post.author.username, post.pk])),
+            "follow_index": (reader, reverse("follow_index")),
+            "search": (reader, reverse("search") + "?" + urlencode(
+                {"q": post.text[:20]})),
+            "new_post": (reader, reverse("new_post")),
+            "post_edit": (author, reverse(
+                "post_edit", args=[author.username, own_post.pk])),
+            # The JSON API next to the pages it mirrors
+            "api_posts": (reader, reverse("api_posts")),
+            "api_group": (reader, reverse(
+                "api_group_posts", args=[group.slug])),
+            "api_profile": (reader, reverse(
+                "api_profile_posts", args=[author.username])),
+            "api_post": (reader, reverse("api_post", args=[post.pk])),
+            "api_comments": (reader, reverse(
+                "api_comments", args=[post.pk])),
+            "api_follow": (reader, reverse("api_follow_posts")),
+        }
+
+    def handle(self, *args, **options):
+        results = {}
+        for name, (user, url) in self.endpoints().items():
+            client = Client()
+            client.force_login(user)
+            timings, queries = [], []
+            for _ in range(options["requests"]):
+                if not options["warm"]:
+                    for alias in settings.CACHES:
+                        if alias != "sessions":
+                            caches[alias].clear()
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    response = client.get(url)
+                    timings.append((time.perf_counter() - started) * 1000)
+                if response.status_code != 200:
+                    raise CommandError(
+                        f"{name}: {url} returned {response.status_code}")
+                queries.append(len(captured))
+            results[name] = {
+                "p50_ms": round(statistics.median(timings), 2),
+                "p95_ms": round(percentile(timings, 0.95), 2),
+                "p99_ms": round(percentile(timings, 0.99), 2),
+                "queries": max(queries),
+            }
+            self.stdout.write(
+                "{:<14} p50 {p50_ms:>8} ms  p95 {p95_ms:>8} ms  "
+                "p99 {p99_ms:>8} ms  {queries:>3} queries".format(
+                    name, **results[name]))
+        if options["save"]:
+            with open(options["save"], "w") as file:
+                json.dump(results, file, indent=2)
+        if options["thresholds"]:
+            self.check_thresholds(
+                results, options["thresholds"], options["tolerance"])
+
+    def check_thresholds(self, results, path, tolerance):
+        """Query counts must not grow, timings may by the tolerance"""
+        with open(path) as file:
+            thresholds = json.load(file)
+        failures = []
+        for name, limits in thresholds.items():
+            for metric, limit in limits.items():
+                if metric.endswith("_ms"):
+                    limit = round(limit * (1 + tolerance), 2)
+                if name in results and results[name][metric] > limit:
+                    failures.append(
+                        f"{name} {metric}: {results[name][metric]} > {limit}")
+        if failures:
+            raise CommandError(
+                "Regressions:\n" + "\n".join(failures))
+        self.stdout.write("All endpoints within thresholds")
@@ -0,0 +1,63 @@
+import multiprocessing
+import resource
+import tempfile
+import time
+
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from posts.forms import PostForm
+
+
+def validate(path, results):
+    """Run the form on the file and report the growth of the peak RSS"""
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    with open(path, "rb") as source:
+        upload = TemporaryUploadedFile("bench.jpg", "image/jpeg", 0, None)
+        while True:
+            chunk = source.read(64 * 2 ** 10)
+            if not chunk:
+                break
+            upload.write(chunk)
+        upload.oversized = False
+        upload.size = upload.tell()
+    form = PostForm({"text": "bench"}, {"image": upload})
+    valid = form.is_valid()
+    elapsed = time.perf_counter() - started
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put((valid, after - before, elapsed))
+
+
+class Command(BaseCommand):
+    help = ("Validate and re-encode generated JPEG uploads of the given "
+            "sizes, each in a fresh process, and report peak RSS growth")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "sizes",
+            nargs="*",
+            default=["1000x1000", "4000x3000", "8000x6000"],
+            help="Image dimensions as WIDTHxHEIGHT",
+        )
+
+    def handle(self, *args, **options):
+        for size in options["sizes"]:
+            try:
+                width, height = map(int, size.split("x"))
+            except ValueError:
+                raise CommandError(f"Bad size {size!r}, use WIDTHxHEIGHT")
+            with tempfile.NamedTemporaryFile(suffix=".jpg") as source:
+                Image.linear_gradient("L").resize((width, height)).save(
+                    source, "JPEG")
+                source.flush()
+                results = multiprocessing.Queue()
+                worker = multiprocessing.Process(
+                    target=validate, args=(source.name, results))
+                worker.start()
+                valid, rss, elapsed = results.get()
+                worker.join()
+            self.stdout.write(
+                f"{size}: {'accepted' if valid else 'rejected'}, "
+                f"+{rss / 1024:.1f} MB peak RSS, {elapsed * 1000:.0f} ms")
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import api
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = ("Issue an API key for a user, to be sent by non-browser "
+            "clients as \"Authorization: Token <key>\"")
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options["username"]).first()
+        if user is None:
+            raise CommandError(f"No user {options['username']}")
+        # Only its digest is stored, the key cannot be shown again
+        self.stdout.write(api.issue_token(user))
@@ -0,0 +1,132 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from posts.models import Comment, Follow, Group, Post, User
+from posts.timeline import timeline_posts
+
+BATCH_SIZE = 500
+
+# Added for the feed queries in migration 0018
+FEED_INDEXES = (
+    "post_date_idx",
+    "post_author_date_idx",
+    "post_group_date_idx",
+    "comment_post_created_idx",
+)
+
+
+class Command(BaseCommand):
+    help = ("Print query plans and timings of the feed queries, "
+            "optionally on a throwaway seeded dataset")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+            metavar="POSTS",
+            help="Seed this many posts first and roll them back at the end",
+        )
+        parser.add_argument(
+            "--runs",
+            type=int,
+            default=20,
+            help="How many times to run each query for the timing",
+        )
+        parser.add_argument(
+            "--compare",
+            action="store_true",
+            help="Also explain the queries without the feed indexes, "
+                 "dropped in a transaction that is rolled back",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options["seed"]:
+                self.seed(options["seed"])
+            self.report(options["runs"], "with feed indexes")
+            if options["compare"]:
+                with transaction.atomic():
+                    self.drop_feed_indexes()
+                    self.report(options["runs"], "without feed indexes")
+                    transaction.set_rollback(True)
+            transaction.set_rollback(bool(options["seed"]))
+
+    def drop_feed_indexes(self):
+        with connection.cursor() as cursor:
+            for name in FEED_INDEXES:
+                cursor.execute(
+                    f"DROP INDEX {connection.ops.quote_name(name)}")
+
+    def seed(self, total):
+        User.objects.bulk_create(
+            User(username=f"explain_{i}")
+            for i in range(max(total // 100, 2)))
+        users = list(User.objects.filter(username__startswith="explain_"))
+        Group.objects.bulk_create(
+            Group(title=f"Группа {i}", slug=f"explain-{i}", description="")
+            for i in range(max(total // 1000, 1)))
+        groups = list(Group.objects.filter(slug__startswith="explain-"))
+        Post.objects.bulk_create(
+            (Post(text=f"Запись {i}", author=random.choice(users),
+                  group=random.choice(groups + [None]))
+             for i in range(total)),
+            batch_size=BATCH_SIZE,
+        )
+        posts = list(Post.objects.values_list("id", flat=True)[:total])
+        Comment.objects.bulk_create(
+            (Comment(post_id=random.choice(posts),
+                     author=random.choice(users), text="Комментарий")
+             for _ in range(total)),
+            batch_size=BATCH_SIZE,
+        )
+        pairs = {(random.choice(users).id, random.choice(users).id)
+                 for _ in range(len(users) * 10)}
+        Follow.objects.bulk_create(
+            (Follow(user_id=user, author_id=author)
+             for user, author in pairs if user != author),
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        self.stdout.write(f"Seeded {total} posts")
+
+    def report(self, runs, label):
+        post = Post.objects.first()
+        if post is None:
+            self.stdout.write("No posts to explain, use --seed")
+            return
+        reader = User.objects.filter(
+            follower__isnull=False).first() or post.author
+        group = Group.objects.filter(posts__isnull=False).first()
+        queries = {
+            "index": Post.objects.for_feed(),
+            "group": Post.objects.filter(group=group),
+            "profile": Post.objects.filter(author_id=post.author_id),
+            "follow_index": timeline_posts(reader),
+            "post comments": Comment.objects.filter(post=post),
+            "follow lookup": Follow.objects.filter(
+                user=reader, author_id=post.author_id),
+        }
+        for name, queryset in queries.items():
+            page = queryset[:10]
+            started = time.perf_counter()
+            for _ in range(runs):
+                list(page)
+            elapsed = (time.perf_counter() - started) * 1000 / runs
+            self.stdout.write(f"== {name}, {label}: {elapsed:.2f} ms ==")
+            self.stdout.write(self.explain(page, label))
+
+    def explain(self, queryset, label):
+        """Like QuerySet.explain(), but never a plan cached before a DROP"""
+        sql, params = queryset.query.sql_with_params()
+        # sqlite3 reuses prepared statements by text, and a reused EXPLAIN
+        # QUERY PLAN still names the dropped indexes
+        sql = f"{connection.ops.explain_query_prefix()} {sql} /* {label} */"
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return "\n".join(
+                " ".join(str(column) for column in row)
+                for row in cursor.fetchall())
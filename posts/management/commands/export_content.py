@@ -0,0 +1,55 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = ("Stream groups, posts, comments and follows into JSON Lines "
+            "or CSV files, one per model")
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory")
+        parser.add_argument(
+            "--format", choices=transfer.FORMATS, default="jsonl")
+        parser.add_argument(
+            "--models",
+            nargs="+",
+            choices=list(transfer.MODELS),
+            default=list(transfer.MODELS),
+        )
+        parser.add_argument("--chunk-size", type=int, default=5000)
+        parser.add_argument(
+            "--images",
+            action="store_true",
+            help="Copy post images into the images/ subdirectory",
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Continue an interrupted export from its checkpoint",
+        )
+
+    def handle(self, *args, **options):
+        directory = options["directory"]
+        os.makedirs(directory, exist_ok=True)
+        checkpoint = transfer.Checkpoint(
+            directory, "export", options["resume"])
+        for name in options["models"]:
+            path = transfer.data_path(directory, name, options["format"])
+            writer = transfer.Writer(
+                path, name, options["format"], append=options["resume"])
+            exported = 0
+            try:
+                for rows in transfer.export_chunks(
+                        name, options["chunk_size"], checkpoint.get(name)):
+                    if options["images"] and name == "posts":
+                        transfer.bundle_images(rows, directory)
+                    writer.write(rows)
+                    checkpoint.set(name, rows[-1]["id"])
+                    exported += len(rows)
+            finally:
+                writer.close()
+            self.stdout.write(f"Exported {exported} {name} to {path}")
+        checkpoint.remove()
@@ -0,0 +1,31 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import write_behind
+
+
+class Command(BaseCommand):
+    help = "Write queued comments and follows to the database in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling the queue instead of exiting",
+        )
+        parser.add_argument("--batch-size", type=int, default=None)
+
+    def handle(self, *args, **options):
+        if not write_behind.enabled():
+            raise CommandError("WRITE_BEHIND_DIR is not set")
+        # Left by a worker that died in the middle of a batch
+        write_behind.recover()
+        while True:
+            flushed = write_behind.flush(batch_size=options["batch_size"])
+            if flushed:
+                self.stdout.write(f"Flushed {flushed} writes")
+            if not options["loop"]:
+                break
+            time.sleep(settings.WRITE_BEHIND_POLL_INTERVAL)
@@ -0,0 +1,158 @@
+import io
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from posts import transfer
+from posts.models import Comment, Follow, Group, Post, User
+
+WORDS = ("кот собака лето город море книга музыка кино друг работа утро "
+         "вечер дорога дом сад снег дождь чай кофе поезд").split()
+
+
+def zipf_weights(count, exponent):
+    """Weights of a power law over ranks, most popular first"""
+    return [1 / (rank ** exponent) for rank in range(1, count + 1)]
+
+
+def sentence(rng, length):
+    return " ".join(rng.choice(WORDS) for _ in range(length)).capitalize()
+
+
+class Command(BaseCommand):
+    help = ("Fill the database with a synthetic dataset: power-law "
+            "follower graph and activity, groups, images and comments")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--posts", type=int, default=20000)
+        parser.add_argument("--groups", type=int, default=50)
+        parser.add_argument("--comments", type=int, default=50000)
+        parser.add_argument(
+            "--follows",
+            type=int,
+            default=20,
+            help="Average number of authors a user follows",
+        )
+        parser.add_argument(
+            "--exponent",
+            type=float,
+            default=1.1,
+            help="Power-law exponent of author popularity and activity",
+        )
+        parser.add_argument(
+            "--images",
+            type=float,
+            default=0.2,
+            help="Share of posts with an image",
+        )
+        parser.add_argument("--days", type=int, default=365)
+        parser.add_argument("--chunk-size", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=None)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        self.chunk_size = options["chunk_size"]
+        prefix = f"gen{self.rng.randrange(10 ** 6)}_"
+        users = self.create_users(prefix, options["users"])
+        groups = self.create_groups(prefix, options["groups"])
+        weights = zipf_weights(len(users), options["exponent"])
+        self.create_follows(users, weights, options["follows"])
+        images = self.create_images() if options["images"] else []
+        self.create_posts(users, weights, groups, images, options)
+        self.create_comments(users, options["comments"], options["days"])
+        transfer.maintain(self.stdout)
+
+    def insert(self, objects):
+        """bulk_create an iterable in chunks of constant size"""
+        for chunk in transfer.chunked(objects, self.chunk_size):
+            with transaction.atomic(), transfer.keep_dates():
+                type(chunk[0]).objects.bulk_create(
+                    chunk, ignore_conflicts=True)
+
+    def create_users(self, prefix, total):
+        password = make_password(None)
+        self.insert(User(username=f"{prefix}{i}", password=password)
+                    for i in range(total))
+        users = list(User.objects.filter(
+            username__startswith=prefix).values_list("pk", flat=True))
+        # Popularity rank is random rather than signup order
+        self.rng.shuffle(users)
+        self.stdout.write(f"Created {len(users)} users")
+        return users
+
+    def create_groups(self, prefix, total):
+        self.insert(
+            Group(title=sentence(self.rng, 2), slug=f"{prefix}{i}",
+                  description=sentence(self.rng, 12))
+            for i in range(total))
+        return list(Group.objects.filter(
+            slug__startswith=prefix).values_list("pk", flat=True))
+
+    def create_follows(self, users, weights, average):
+        def follows():
+            for user in users:
+                count = min(int(self.rng.paretovariate(1.5) * average / 3),
+                            len(users) - 1)
+                authors = set(self.rng.choices(users, weights, k=count))
+                authors.discard(user)
+                for author in authors:
+                    yield Follow(user_id=user, author_id=author)
+        self.insert(follows())
+        self.stdout.write(f"Created {Follow.objects.count()} follows")
+
+    def create_images(self):
+        """A handful of distinct images shared by many posts"""
+        storage = Post._meta.get_field("image").storage
+        names = []
+        for i in range(10):
+            file = io.BytesIO()
+            size = (self.rng.randrange(400, 2000),
+                    self.rng.randrange(300, 1500))
+            color = tuple(self.rng.randrange(256) for _ in range(3))
+            Image.new("RGB", size, color).save(file, "JPEG")
+            names.append(storage.save(
+                f"posts/generated{i}.jpg", ContentFile(file.getvalue())))
+        return names
+
+    def create_posts(self, users, weights, groups, images, options):
+        now = timezone.now()
+
+        def posts():
+            authors = self.rng.choices(users, weights, k=options["posts"])
+            for author in authors:
+                yield Post(
+                    author_id=author,
+                    text=sentence(self.rng, self.rng.randrange(5, 60)),
+                    group_id=self.rng.choice(groups + [None]) if groups
+                    else None,
+                    image=self.rng.choice(images)
+                    if images and self.rng.random() < options["images"]
+                    else None,
+                    pub_date=now - timedelta(
+                        seconds=self.rng.randrange(options["days"] * 86400)),
+                )
+        self.insert(posts())
+        self.stdout.write(f"Created {options['posts']} posts")
+
+    def create_comments(self, users, total, days):
+        post_ids = list(Post.objects.values_list("pk", flat=True))
+        if not post_ids:
+            return
+        now = timezone.now()
+        # Popular posts gather most of the comments
+        weights = zipf_weights(len(post_ids), 1.0)
+        self.rng.shuffle(post_ids)
+        self.insert(
+            Comment(post_id=post_id, author_id=self.rng.choice(users),
+                    text=sentence(self.rng, self.rng.randrange(3, 20)),
+                    created=now - timedelta(
+                        seconds=self.rng.randrange(days * 86400)))
+            for post_id in self.rng.choices(post_ids, weights, k=total))
+        self.stdout.write(f"Created {total} comments")
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = ("Load files written by export_content in chunks, keeping "
+            "their ids, then rebuild counters, timelines and search")
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory")
+        parser.add_argument("--chunk-size", type=int, default=5000)
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Skip the rows an interrupted import already loaded",
+        )
+        parser.add_argument(
+            "--no-maintenance",
+            action="store_false",
+            dest="maintenance",
+            help="Leave rebuilding derived data for after the last import",
+        )
+
+    def handle(self, *args, **options):
+        directory = options["directory"]
+        checkpoint = transfer.Checkpoint(
+            directory, "import", options["resume"])
+        found = False
+        clashing = set(checkpoint.get("clashing posts", []))
+        for name in transfer.MODELS:
+            file_format = transfer.find_format(directory, name)
+            if file_format is None:
+                continue
+            found = True
+            done = checkpoint.get(name)
+            rows = transfer.read_rows(
+                transfer.data_path(directory, name, file_format), file_format,
+                skip=done)
+            skipped = 0
+            for chunk in transfer.chunked(rows, options["chunk_size"]):
+                if name == "posts":
+                    clashing |= transfer.clashing_posts(chunk)
+                    checkpoint.set("clashing posts", sorted(clashing))
+                skipped += transfer.import_chunk(
+                    name, chunk, directory, clashing)
+                done += len(chunk)
+                checkpoint.set(name, done)
+            self.stdout.write(f"Imported {done} {name}")
+            if skipped:
+                self.stdout.write(self.style.WARNING(
+                    f"Skipped {skipped} {name} whose id is taken or whose "
+                    f"post was not imported"))
+        if not found:
+            raise CommandError(f"No exported files in {directory}")
+        if options["maintenance"]:
+            transfer.maintain(self.stdout)
+        checkpoint.remove()
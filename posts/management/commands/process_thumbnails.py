@@ -0,0 +1,65 @@
+import multiprocessing
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import thumbnails
+
+
+def generate(post_id):
+    try:
+        thumbnails.generate(post_id)
+    except Exception as error:
+        return post_id, repr(error)
+    return post_id, None
+
+
+class Command(BaseCommand):
+    help = "Generate thumbnails for posts whose images are not processed yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling for new uploads instead of exiting",
+        )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=1,
+            help="Worker processes resizing images in parallel",
+        )
+        parser.add_argument("--batch-size", type=int, default=100)
+
+    def handle(self, *args, **options):
+        pool = None
+        if options["processes"] > 1:
+            connections.close_all()
+            pool = multiprocessing.Pool(
+                options["processes"], initializer=connections.close_all)
+        try:
+            while True:
+                self.process_queue(pool, options["batch_size"])
+                if not options["loop"]:
+                    break
+                time.sleep(settings.THUMBNAIL_POLL_INTERVAL)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+    def process_queue(self, pool, batch_size):
+        """Go through the queue once; failed images are retried next pass"""
+        last_id = 0
+        while True:
+            ids = list(thumbnails.pending().filter(id__gt=last_id).order_by(
+                "id").values_list("id", flat=True)[:batch_size])
+            if not ids:
+                return
+            results = pool.map(generate, ids) if pool else map(generate, ids)
+            for post_id, error in results:
+                if error:
+                    self.stderr.write(f"Post {post_id}: {error}")
+            last_id = ids[-1]
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from posts import search
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = "Rebuild search documents of posts, e.g. after migrating"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--missing",
+            action="store_true",
+            help="Only index posts that have no search document yet",
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.all()
+        if options["missing"]:
+            posts = posts.filter(search_document__isnull=True)
+        total = posts.count()
+        search.index_posts(posts)
+        self.stdout.write(f"Indexed {total} posts")
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from posts import timeline
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = "Rebuild materialized subscription feeds from follows"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "usernames",
+            nargs="*",
+            help="Only rebuild feeds of these users",
+        )
+        parser.add_argument(
+            "--pending",
+            action="store_true",
+            help="Only backfill followers of authors who dropped below "
+                 "TIMELINE_FANOUT_LIMIT",
+        )
+
+    def handle(self, *args, **options):
+        if options["pending"]:
+            backfilled = timeline.backfill_pending()
+            self.stdout.write(f"Backfilled followers of {backfilled} authors")
+            return
+        users = User.objects.filter(
+            Q(follower__isnull=False) | Q(timeline__isnull=False),
+        ).distinct()
+        if options["usernames"]:
+            users = users.filter(username__in=options["usernames"])
+        rebuilt = 0
+        for user in users.iterator():
+            timeline.rebuild(user)
+            rebuilt += 1
+        self.stdout.write(f"Rebuilt {rebuilt} timelines")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = "Recompute comment, post and follow counters that drifted"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            posts, stats = counters.reconcile()
+        self.stdout.write(
+            f"Fixed {posts} posts and {stats} author stats rows")
@@ -0,0 +1,224 @@
+"""Per-request instrumentation.
+
+MetricsMiddleware times every SQL query of a request, the rendering of
+its top-level template (through the Templates backend) and the page
+cache lookups reported by cached_page, then
+
+* sends the figures back in a Server-Timing header,
+* adds them to per-view totals served at /metrics/ in the Prometheus
+  text format,
+* logs requests slower than METRICS_SLOW_REQUEST_MS with their slowest
+  and repeated SQL, leaving out the parameters, which may be personal.
+
+The totals live in the worker process, so every worker reports its own.
+"""
+import hmac
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from django.template.backends.django import DjangoTemplates
+
+logger = logging.getLogger("yatube.slow_requests")
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_local = threading.local()
+
+
+class RequestMetrics:
+
+    def __init__(self):
+        self.queries = []
+        self.render = 0.0
+        self.cache = Counter()
+
+    def execute(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append(
+                (sql, repr(params), time.perf_counter() - started))
+
+    @property
+    def db(self):
+        return sum(seconds for _, _, seconds in self.queries)
+
+    @property
+    def duplicates(self):
+        return len(self.queries) - len(
+            {(sql, params) for sql, params, _ in self.queries})
+
+
+def current():
+    return getattr(_local, "metrics", None)
+
+
+def record_cache(hit):
+    metrics = current()
+    if metrics is not None:
+        metrics.cache["hit" if hit else "miss"] += 1
+
+
+class TimedTemplate:
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            metrics = current()
+            if metrics is not None:
+                metrics.render += time.perf_counter() - started
+
+
+class Templates(DjangoTemplates):
+    """Django templates that report their render time"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+class Registry:
+    """Per-view totals since the worker started"""
+
+    COUNTERS = (
+        ("requests_total", "Requests served"),
+        ("queries_total", "SQL queries run"),
+        ("duplicate_queries_total", "SQL queries repeated within a request"),
+        ("db_seconds_total", "Time spent in SQL queries"),
+        ("render_seconds_total", "Time spent rendering templates"),
+        ("page_cache_hits_total", "Page cache hits"),
+        ("page_cache_misses_total", "Page cache misses"),
+    )
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = defaultdict(Counter)
+        self.buckets = defaultdict(Counter)
+
+    def observe(self, view, metrics, duration):
+        with self.lock:
+            totals = self.totals[view]
+            totals["requests_total"] += 1
+            totals["queries_total"] += len(metrics.queries)
+            totals["duplicate_queries_total"] += metrics.duplicates
+            totals["db_seconds_total"] += metrics.db
+            totals["render_seconds_total"] += metrics.render
+            totals["page_cache_hits_total"] += metrics.cache["hit"]
+            totals["page_cache_misses_total"] += metrics.cache["miss"]
+            totals["duration_seconds_sum"] += duration
+            for bound in BUCKETS:
+                if duration <= bound:
+                    self.buckets[view][bound] += 1
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, description in self.COUNTERS:
+                lines.append(f"# HELP yatube_{name} {description}")
+                lines.append(f"# TYPE yatube_{name} counter")
+                for view, totals in sorted(self.totals.items()):
+                    lines.append(
+                        f'yatube_{name}{{view="{view}"}} {totals[name]}')
+            name = "yatube_request_duration_seconds"
+            lines.append(f"# HELP {name} Time to build the response")
+            lines.append(f"# TYPE {name} histogram")
+            for view, totals in sorted(self.totals.items()):
+                for bound in BUCKETS:
+                    lines.append(
+                        f'{name}_bucket{{view="{view}",le="{bound}"}} '
+                        f"{self.buckets[view][bound]}")
+                lines.append(f'{name}_bucket{{view="{view}",le="+Inf"}} '
+                             f"{totals['requests_total']}")
+                lines.append(f'{name}_sum{{view="{view}"}} '
+                             f"{totals['duration_seconds_sum']}")
+                lines.append(f'{name}_count{{view="{view}"}} '
+                             f"{totals['requests_total']}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def server_timing(metrics, duration):
+    entries = [
+        f'db;dur={metrics.db * 1000:.1f};desc="{len(metrics.queries)} '
+        f'queries, {metrics.duplicates} repeated"',
+        f"render;dur={metrics.render * 1000:.1f}",
+        f"total;dur={duration * 1000:.1f}",
+    ]
+    if metrics.cache:
+        state = "hit" if metrics.cache["hit"] else "miss"
+        entries.append(f'cache;desc="{state}"')
+    return ", ".join(entries)
+
+
+def log_slow(request, metrics, duration):
+    slowest = sorted(metrics.queries, key=lambda query: -query[2])[:5]
+    repeated = Counter(sql for sql, _, _ in metrics.queries).most_common(3)
+    logger.warning(
+        "Slow request %s %s: %.0f ms, %d queries in %.0f ms\n"
+        "Slowest:\n%s\nMost repeated:\n%s",
+        request.method, request.get_full_path(), duration * 1000,
+        len(metrics.queries), metrics.db * 1000,
+        "\n".join(f"  {seconds * 1000:.1f} ms {sql}"
+                  for sql, _, seconds in slowest),
+        "\n".join(f"  {count}x {sql}" for sql, count in repeated if count > 1),
+    )
+
+
+class MetricsMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = _local.metrics = RequestMetrics()
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(metrics.execute))
+                response = self.get_response(request)
+        finally:
+            _local.metrics = None
+        duration = time.perf_counter() - started
+        match = getattr(request, "resolver_match", None)
+        view = match.view_name if match else "unresolved"
+        registry.observe(view, metrics, duration)
+        response["Server-Timing"] = server_timing(metrics, duration)
+        if duration * 1000 >= settings.METRICS_SLOW_REQUEST_MS:
+            log_slow(request, metrics, duration)
+        return response
+
+
+def scrape_allowed(request):
+    token = settings.METRICS_TOKEN
+    authorization = request.META.get("HTTP_AUTHORIZATION", "")
+    return bool(token) and hmac.compare_digest(
+        authorization.encode(), f"Bearer {token}".encode())
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint, open to METRICS_TOKEN holders and staff"""
+    if not (scrape_allowed(request) or request.user.is_staff):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        registry.render(), content_type="text/plain; version=0.0.4")
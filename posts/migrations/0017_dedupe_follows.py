@@ -0,0 +1,38 @@
+from django.db import migrations
+from django.db.models import Count, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_of(model, field):
+    rows = model.objects.filter(**{field: OuterRef("pk")}).order_by()
+    return Coalesce(Subquery(
+        rows.values(field).annotate(n=Count("pk")).values("n")), 0)
+
+
+def dedupe_follows(apps, schema_editor):
+    """Keep the oldest of duplicate follows so a unique constraint fits"""
+    Follow = apps.get_model("posts", "Follow")
+    AuthorStats = apps.get_model("posts", "AuthorStats")
+    duplicates = Follow.objects.values("user", "author").annotate(
+        keep=Min("id"), total=Count("id")).filter(total__gt=1)
+    touched = set()
+    for row in duplicates:
+        Follow.objects.filter(
+            user=row["user"], author=row["author"],
+        ).exclude(id=row["keep"]).delete()
+        touched.update((row["user"], row["author"]))
+    AuthorStats.objects.filter(user__in=touched).update(
+        followers_count=count_of(Follow, "author"),
+        following_count=count_of(Follow, "user"),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_follows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 2.2.6 on 2026-10-18 04:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+SQLITE = [
+    """CREATE VIRTUAL TABLE posts_search_fts USING fts5(
+        content,
+        content='posts_searchdocument',
+        content_rowid='post_id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER posts_search_ai AFTER INSERT ON posts_searchdocument
+    BEGIN
+        INSERT INTO posts_search_fts(rowid, content)
+        VALUES (new.post_id, new.content);
+    END""",
+    """CREATE TRIGGER posts_search_ad AFTER DELETE ON posts_searchdocument
+    BEGIN
+        INSERT INTO posts_search_fts(posts_search_fts, rowid, content)
+        VALUES ('delete', old.post_id, old.content);
+    END""",
+    """CREATE TRIGGER posts_search_au AFTER UPDATE ON posts_searchdocument
+    BEGIN
+        INSERT INTO posts_search_fts(posts_search_fts, rowid, content)
+        VALUES ('delete', old.post_id, old.content);
+        INSERT INTO posts_search_fts(rowid, content)
+        VALUES (new.post_id, new.content);
+    END""",
+]
+
+SQLITE_REVERSE = [
+    "DROP TRIGGER posts_search_au",
+    "DROP TRIGGER posts_search_ad",
+    "DROP TRIGGER posts_search_ai",
+    "DROP TABLE posts_search_fts",
+]
+
+# The content is stemmed already, so the "simple" configuration is used
+POSTGRESQL = [
+    """CREATE INDEX posts_search_tsv_idx ON posts_searchdocument
+    USING gin (to_tsvector('simple', content))""",
+]
+
+POSTGRESQL_REVERSE = ["DROP INDEX posts_search_tsv_idx"]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        for statement in statements.get(vendor, []):
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0021_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='posts.Post', verbose_name='Запись')),
+                ('content', models.TextField(verbose_name='Слова')),
+            ],
+            options={
+                'verbose_name': 'Поисковый документ',
+                'verbose_name_plural': 'Поисковые документы',
+            },
+        ),
+        migrations.RunPython(
+            run({"sqlite": SQLITE, "postgresql": POSTGRESQL}),
+            run({"sqlite": SQLITE_REVERSE,
+                 "postgresql": POSTGRESQL_REVERSE}),
+        ),
+    ]
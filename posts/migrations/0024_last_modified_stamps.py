@@ -0,0 +1,23 @@
+# Generated by Django 2.2.6 on 2026-10-18 04:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0023_comment_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='authorstats',
+            name='last_modified',
+            field=models.DateTimeField(auto_now=True, verbose_name='Последнее изменение'),
+        ),
+        migrations.AddField(
+            model_name='group',
+            name='last_modified',
+            field=models.DateTimeField(auto_now=True, verbose_name='Последнее изменение'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.6 on 2026-10-18 05:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0024_last_modified_stamps'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='write_id',
+            field=models.UUIDField(editable=False, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.6 on 2026-10-18 05:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0025_comment_write_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='authorstats',
+            name='backfill_pending',
+            field=models.BooleanField(default=False),
+        ),
+    ]
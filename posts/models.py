@@ -1,5 +1,9 @@
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .storage import ContentAddressedStorage
 
 User = get_user_model()
 
@@ -12,14 +16,37 @@ class Group(models.Model):
     title = models.CharField(max_length=200, verbose_name="Заголовок")
     slug = models.SlugField(max_length=220, unique=True, verbose_name="Адрес")
     description = models.TextField(verbose_name="Описание")
+    # Last change to anything shown on the group page, see signals
+    last_modified = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Последнее изменение",
+    )
 
     def __str__(self):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Fetch everything a feed page renders for each post.
+
+        Comments are not prefetched, see posts.comments for their windows.
+        """
+        return self.select_related("author", "group")
+
+
 class Post(models.Model):
     class Meta:
         ordering = ("-pub_date", )
+        indexes = [
+            models.Index(fields=["-pub_date"], name="post_date_idx"),
+            models.Index(fields=["author", "-pub_date"],
+                         name="post_author_date_idx"),
+            models.Index(fields=["group", "-pub_date"],
+                         name="post_group_date_idx"),
+            models.Index(fields=["id"], name="post_thumbnails_pending_idx",
+                         condition=models.Q(thumbnails_ready=False)),
+        ]
         verbose_name = "Запись"
         verbose_name_plural = "Записи"
 
@@ -44,19 +71,73 @@ class Post(models.Model):
     )
     image = models.ImageField(
         upload_to="posts/",
+        storage=ContentAddressedStorage(),
         blank=True,
         null=True,
         verbose_name="Изображение"
     )
+    comment_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Комментариев",
+    )
+    version = models.PositiveIntegerField(
+        default=1,
+        editable=False,
+        verbose_name="Версия",
+    )
+    thumbnails_ready = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name="Миниатюры готовы",
+    )
+
+    objects = PostQuerySet.as_manager()
+
+    # Maintained with UPDATE ... SET field = field + n, never by save()
+    COUNTER_FIELDS = ("comment_count", "version")
 
     def __str__(self):
         return (f'pk={self.pk} author={self.author} group={self.group} '
                 f'date={self.pub_date} {self.text[:70]}')
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        post = super().from_db(db, field_names, values)
+        # Lets signals invalidate the group a post is moved out of
+        # and save() notice a replaced image
+        post.loaded_group_id = post.__dict__.get("group_id")
+        post.loaded_image = post.__dict__.get("image")
+        return post
+
+    def save(self, *args, **kwargs):
+        """Save an edit without clobbering counters and bump the version"""
+        if self._state.adding or kwargs.get("update_fields") is not None:
+            return super().save(*args, **kwargs)
+        if self.image.name != getattr(self, "loaded_image", None):
+            self.thumbnails_ready = False
+        kwargs["update_fields"] = [
+            field.name for field in self._meta.concrete_fields
+            if not field.primary_key and field.name not in self.COUNTER_FIELDS
+        ]
+        super().save(*args, **kwargs)
+        self.bump_version()
+
+    def bump_version(self):
+        Post.objects.filter(pk=self.pk).update(
+            version=models.F("version") + 1)
+        self.version += 1
+
 
 class Comment(models.Model):
     class Meta:
         ordering = ("-created", )
+        indexes = [
+            models.Index(fields=["post", "-created"],
+                         name="comment_post_created_idx"),
+            # Admin date hierarchy and changelist ordering
+            models.Index(fields=["-created"], name="comment_created_idx"),
+        ]
         verbose_name = "Комментарий"
         verbose_name_plural = "Комментарии"
 
@@ -77,10 +158,16 @@ class Comment(models.Model):
         auto_now_add=True,
         verbose_name="Дата публикации",
     )
+    # Id of the queued write the comment came from, see write_behind
+    write_id = models.UUIDField(null=True, unique=True, editable=False)
 
 
 class Follow(models.Model):
     class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "author"],
+                                    name="unique_follow"),
+        ]
         verbose_name = "Подписка"
         verbose_name_plural = "Подписки"
 
@@ -96,3 +183,128 @@ class Follow(models.Model):
         related_name="following",
         verbose_name="Автор",
     )
+
+
+class TimelineEntry(models.Model):
+    """A post fanned out to one follower's subscription feed"""
+    class Meta:
+        unique_together = ("user", "post")
+        verbose_name = "Запись ленты подписок"
+        verbose_name_plural = "Записи ленты подписок"
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="timeline",
+        verbose_name="Читатель",
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name="timeline_entries",
+        verbose_name="Запись",
+    )
+
+
+class AuthorStatsManager(models.Manager):
+    def for_user(self, user):
+        stats, _ = self.get_or_create(user=user)
+        return stats
+
+    def bump(self, user_id, **deltas):
+        """Atomically add deltas to the user's counters"""
+        changes = {
+            field: Greatest(models.F(field) + delta, 0)
+            for field, delta in deltas.items()
+        }
+        changes["last_modified"] = timezone.now()
+        if self.filter(user_id=user_id).update(**changes):
+            return
+        # A missing row only needs creating for an increment: decrements
+        # also come from the cascade deleting the user and their stats
+        if any(delta > 0 for delta in deltas.values()):
+            self.get_or_create(user_id=user_id)
+            self.filter(user_id=user_id).update(**changes)
+
+    def touch(self, *user_ids):
+        """Mark the profile pages of the users as changed"""
+        self.filter(user_id__in=user_ids).update(
+            last_modified=timezone.now())
+
+
+class AuthorStats(models.Model):
+    """Denormalized per-user counters shown on the profile page"""
+    class Meta:
+        verbose_name = "Статистика автора"
+        verbose_name_plural = "Статистика авторов"
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="stats",
+        verbose_name="Пользователь",
+    )
+    posts_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Записей",
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Подписчиков",
+    )
+    following_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Подписок",
+    )
+    # Last change to anything shown on the profile page, see signals
+    last_modified = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Последнее изменение",
+    )
+    # Dropped below TIMELINE_FANOUT_LIMIT, followers not backfilled yet
+    backfill_pending = models.BooleanField(default=False)
+
+    objects = AuthorStatsManager()
+
+
+class SearchDocument(models.Model):
+    """Stemmed words of a post, its comments, group and author.
+
+    Indexed by the posts_search_fts FTS5 table on SQLite and by a GIN
+    tsvector index on PostgreSQL, both created in migration 0022.
+    """
+    class Meta:
+        verbose_name = "Поисковый документ"
+        verbose_name_plural = "Поисковые документы"
+
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="search_document",
+        verbose_name="Запись",
+    )
+    content = models.TextField(verbose_name="Слова")
+
+
+class ApiToken(models.Model):
+    """Key of an API client that has no browser session.
+
+    Only the SHA-256 of the key is stored, see api.issue_token().
+    """
+    class Meta:
+        verbose_name = "Ключ API"
+        verbose_name_plural = "Ключи API"
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="api_tokens",
+        verbose_name="Пользователь",
+    )
+    digest = models.CharField(max_length=64, unique=True, editable=False)
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Создан",
+    )
@@ -0,0 +1,194 @@
+"""Whole-page cache for the feeds, invalidated by events.
+
+Every cached page belongs to a few scopes ("index", "group:<slug>",
+"profile:<username>" and "all"). Each scope has a version number in the
+default cache, and a page is stored in the "pages" cache under the
+versions it was rendered with. Signals bump the versions of the scopes a
+write affects, so the next request misses and re-renders while the old
+copies simply expire.
+
+While one request re-renders a page the others get the previous copy
+instead of piling onto the database.
+
+Pages are rendered for an anonymous visitor and shared by everyone. The
+parts that depend on the viewer (navigation, CSRF tokens, edit and follow
+controls) are {% hole %} tags: the stored page keeps a placeholder and the
+hole's arguments, and every response fills the placeholders for its own
+viewer from small templates.
+"""
+import hashlib
+import re
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache, caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+
+from .metrics import record_cache
+from .models import Group, Post, User
+
+ALL = "all"
+
+HOLE = "<!--hole:{}-->"
+
+HOLE_PATTERN = re.compile(rb"<!--hole:(\d+)-->")
+
+
+def version_key(scope):
+    return f"page-version:{scope}"
+
+
+def get_versions(scopes):
+    keys = [version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # A lost counter restarts from the clock so that it never
+            # matches a version some stored page was rendered with.
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump(*scopes):
+    """Move the scopes to new versions once the transaction commits.
+
+    Bumping earlier would let a request render the uncommitted state and
+    store it under the new versions until PAGE_CACHE_TIMEOUT.
+    """
+    def incr():
+        for scope in scopes:
+            try:
+                cache.incr(version_key(scope))
+            except ValueError:
+                pass
+    transaction.on_commit(incr)
+
+
+def forget_post_pages(post):
+    group_ids = {post.group_id, getattr(post, "loaded_group_id", None)}
+    group_ids.discard(None)
+    slugs = Group.objects.filter(pk__in=group_ids).values_list(
+        "slug", flat=True) if group_ids else []
+    bump(
+        "index",
+        f"profile:{post.author.username}",
+        *(f"group:{slug}" for slug in slugs),
+    )
+
+
+def forget_comment_pages(post_id):
+    post = Post.objects.filter(pk=post_id).values(
+        "author__username", "group__slug").first()
+    if post is None:
+        return
+    scopes = ["index", f"profile:{post['author__username']}"]
+    if post["group__slug"]:
+        scopes.append(f"group:{post['group__slug']}")
+    bump(*scopes)
+
+
+def forget_profile_pages(*user_ids):
+    usernames = User.objects.filter(pk__in=user_ids).values_list(
+        "username", flat=True)
+    bump(*(f"profile:{username}" for username in usernames))
+
+
+def render_hole(request, template_name, values):
+    """Render a hole now, or leave a placeholder in a page being cached"""
+    holes = getattr(request, "page_holes", None)
+    if holes is None:
+        return render_to_string(template_name, values, request)
+    holes.append((template_name, values))
+    return HOLE.format(len(holes) - 1)
+
+
+def fill_holes(request, content, holes):
+    if not holes:
+        return content
+    rendered = [
+        render_to_string(template_name, values, request).encode()
+        for template_name, values in holes
+    ]
+    return HOLE_PATTERN.sub(
+        lambda match: rendered[int(match.group(1))], content)
+
+
+def cached_response(request, content, holes, headers=()):
+    """Rebuild a stored page, with the headers the view gave it"""
+    response = HttpResponse(fill_holes(request, content, holes))
+    for header, value in headers:
+        response[header] = value
+    return response
+
+
+def render_shared(view, request, *args, **kwargs):
+    """Render the view as an anonymous visitor would see it.
+
+    Return the response and the holes left in its content.
+    """
+    user = request.user
+    request.user = AnonymousUser()
+    request.page_holes = []
+    try:
+        response = view(request, *args, **kwargs)
+    finally:
+        request.user = user
+        holes = request.page_holes
+        del request.page_holes
+    return response, holes
+
+
+def digest(*parts):
+    return hashlib.md5(":".join(map(str, parts)).encode()).hexdigest()
+
+
+def cached_page(*scopes):
+    """Cache a view's page until one of its scopes changes.
+
+    Scopes may contain {placeholders} filled from the URL kwargs, e.g.
+    cached_page("group:{slug}").
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(request, *args, **kwargs)
+            names = [ALL] + [scope.format(**kwargs) for scope in scopes]
+            page = digest(request.get_full_path())
+            key = "page:" + digest(page, *get_versions(names))
+            stale_key = "page-stale:" + page
+            pages = caches["pages"]
+            stored = pages.get(key)
+            if stored is not None:
+                record_cache(hit=True)
+                return cached_response(request, *stored)
+            lock_key = key + ":lock"
+            locked = pages.add(lock_key, 1, settings.PAGE_CACHE_LOCK_TIMEOUT)
+            if not locked:
+                stale = pages.get(stale_key)
+                if stale is not None:
+                    record_cache(hit=True)
+                    return cached_response(request, *stale)
+            record_cache(hit=False)
+            try:
+                response, holes = render_shared(
+                    view, request, *args, **kwargs)
+                if not response.streaming:
+                    stored = (response.content, holes, list(response.items()))
+                    if response.status_code == 200:
+                        pages.set_many({
+                            key: stored,
+                            stale_key: stored,
+                        }, settings.PAGE_CACHE_TIMEOUT)
+                    response.content = fill_holes(request, *stored[:2])
+            finally:
+                if locked:
+                    pages.delete(lock_key)
+            return response
+        return wrapper
+    return decorator
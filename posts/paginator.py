@@ -0,0 +1,155 @@
+import base64
+import binascii
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+
+POSTS_PER_PAGE = 10
+
+NEXT = "n"
+PREVIOUS = "p"
+
+
+class CursorPage:
+    """A slice of a feed with opaque cursors to its neighbours"""
+
+    def __init__(self, object_list, paginator, next_cursor=None,
+                 previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f"<CursorPage of {len(self)} items>"
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """Keyset paginator over the model's descending Meta.ordering plus id.
+
+    Unlike Paginator it never counts rows or skips them with OFFSET:
+    a page is fetched with a WHERE on the keys of the last item seen.
+    """
+    is_cursor = True
+
+    def __init__(self, object_list, per_page):
+        model = object_list.model
+        self.keys = [key.lstrip("-") for key in model._meta.ordering]
+        if "id" not in self.keys:
+            self.keys.append("id")
+        self.fields = [model._meta.get_field(key) for key in self.keys]
+        self.object_list = object_list
+        self.per_page = per_page
+
+    def _value(self, item, key):
+        if isinstance(item, dict):
+            return item[key]
+        return getattr(item, key)
+
+    def encode(self, direction, item):
+        values = [str(self._value(item, key)) for key in self.keys]
+        raw = "|".join([direction] + values).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    def decode(self, cursor):
+        """Return (direction, key values) or None for a broken cursor"""
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            raw = base64.urlsafe_b64decode(padded.encode()).decode()
+            direction, *values = raw.split("|")
+            if direction not in (NEXT, PREVIOUS):
+                return None
+            if len(values) != len(self.fields):
+                return None
+            return direction, [
+                field.to_python(value)
+                for field, value in zip(self.fields, values)
+            ]
+        except (binascii.Error, UnicodeDecodeError, ValidationError,
+                ValueError):
+            return None
+
+    def _seek(self, values, direction):
+        """Filter for rows strictly after (NEXT) or before the cursor"""
+        lookup = "lt" if direction == NEXT else "gt"
+        condition = Q()
+        for i, key in enumerate(self.keys):
+            equal = {k: v for k, v in zip(self.keys[:i], values[:i])}
+            condition |= Q(**equal, **{f"{key}__{lookup}": values[i]})
+        return condition
+
+    def _ordered(self, direction):
+        sign = "-" if direction == NEXT else ""
+        return self.object_list.order_by(
+            *[f"{sign}{key}" for key in self.keys])
+
+    def _page(self, items, has_next, has_previous):
+        return CursorPage(
+            items,
+            self,
+            next_cursor=(self.encode(NEXT, items[-1])
+                         if has_next and items else None),
+            previous_cursor=(self.encode(PREVIOUS, items[0])
+                             if has_previous and items else None),
+        )
+
+    def get_page(self, cursor=None, page=None):
+        decoded = self.decode(cursor) if cursor else None
+        if decoded is None:
+            return self._compat_page(page)
+        direction, values = decoded
+        items = list(self._ordered(direction).filter(
+            self._seek(values, direction))[:self.per_page + 1])
+        more = len(items) > self.per_page
+        items = items[:self.per_page]
+        if direction == PREVIOUS:
+            items.reverse()
+            return self._page(items, has_next=True, has_previous=more)
+        return self._page(items, has_next=more, has_previous=True)
+
+    def _compat_page(self, page):
+        """Serve old ?page=N links for the first few pages with OFFSET"""
+        try:
+            number = int(page)
+        except (TypeError, ValueError):
+            number = 1
+        if not 1 <= number <= settings.POSTS_CURSOR_COMPAT_PAGES:
+            number = 1
+        offset = (number - 1) * self.per_page
+        items = list(
+            self._ordered(NEXT)[offset:offset + self.per_page + 1])
+        more = len(items) > self.per_page
+        return self._page(items[:self.per_page], has_next=more,
+                          has_previous=number > 1)
+
+
+def paginate(request, object_list, view_name):
+    """Return (paginator, page) in the mode configured for the view"""
+    if view_name in settings.POSTS_CURSOR_PAGINATION:
+        paginator = CursorPaginator(object_list, POSTS_PER_PAGE)
+        page = paginator.get_page(
+            request.GET.get("cursor"), request.GET.get("page"))
+    else:
+        paginator = Paginator(object_list, POSTS_PER_PAGE)
+        page = paginator.get_page(request.GET.get("page"))
+    return paginator, page
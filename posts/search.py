@@ -0,0 +1,147 @@
+"""Full-text search over posts.
+
+Each post has a SearchDocument holding the stemmed words of its text,
+comments, group title and author names, rebuilt by signals whenever one
+of them changes; new comments only append their words. The database
+indexes the documents (FTS5 on SQLite, a tsvector GIN index on
+PostgreSQL) and ranks the matches. The ranked ids of a query are cached
+for a while so that turning pages does not run the search again.
+"""
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Concat
+
+from .models import Comment, Post, SearchDocument
+from .page_cache import digest
+from .stemmer import stem
+
+WORD = re.compile(r"\w+")
+
+CYRILLIC = re.compile(r"[а-я]")
+
+BATCH_SIZE = 500
+
+QUERIES = {
+    "sqlite": """
+        SELECT rowid FROM posts_search_fts
+        WHERE posts_search_fts MATCH %s
+        ORDER BY rank
+        LIMIT %s
+    """,
+    "postgresql": """
+        SELECT post_id FROM posts_searchdocument
+        WHERE to_tsvector('simple', content) @@ to_tsquery('simple', %s)
+        ORDER BY ts_rank(to_tsvector('simple', content),
+                         to_tsquery('simple', %s)) DESC
+        LIMIT %s
+    """,
+}
+
+# Every match, unranked, for narrowing a queryset
+MATCHES = {
+    "sqlite": """
+        SELECT rowid FROM posts_search_fts WHERE posts_search_fts MATCH %s
+    """,
+    "postgresql": """
+        SELECT post_id FROM posts_searchdocument
+        WHERE to_tsvector('simple', content) @@ to_tsquery('simple', %s)
+    """,
+}
+
+
+def terms(text):
+    """Split text into normalized words, stemming the Russian ones"""
+    words = WORD.findall(text.lower().replace("ё", "е"))
+    return [stem(word) if CYRILLIC.match(word) else word for word in words]
+
+
+def document(post, comments):
+    author = post.author
+    parts = [post.text, author.username, author.first_name, author.last_name]
+    if post.group is not None:
+        parts.append(post.group.title)
+    parts.extend(comments)
+    return " ".join(terms(" ".join(parts)))
+
+
+def index_post(post_id):
+    post = Post.objects.select_related("author", "group").filter(
+        pk=post_id).first()
+    if post is not None:
+        comments = Comment.objects.filter(post=post).values_list(
+            "text", flat=True)
+        SearchDocument.objects.update_or_create(
+            post=post, defaults={"content": document(post, comments)})
+
+
+def add_comments(post_id, texts):
+    """Append the words of new comments to the post's document"""
+    words = " ".join(terms(" ".join(texts)))
+    added = SearchDocument.objects.filter(post_id=post_id).update(
+        content=Concat(F("content"), Value(" " + words)))
+    if not added:
+        index_post(post_id)
+
+
+def index_posts(posts):
+    """Rebuild the documents of many posts, a batch per transaction"""
+    ids = list(posts.order_by("pk").values_list("pk", flat=True))
+    for start in range(0, len(ids), BATCH_SIZE):
+        batch = ids[start:start + BATCH_SIZE]
+        comments = {}
+        for post_id, text in Comment.objects.filter(
+                post_id__in=batch).values_list("post_id", "text"):
+            comments.setdefault(post_id, []).append(text)
+        documents = [
+            SearchDocument(
+                post=post, content=document(post, comments.get(post.pk, [])))
+            for post in Post.objects.filter(pk__in=batch).select_related(
+                "author", "group")
+        ]
+        with transaction.atomic():
+            SearchDocument.objects.filter(post_id__in=batch).delete()
+            SearchDocument.objects.bulk_create(documents)
+
+
+def match_expression(words):
+    if connection.vendor == "postgresql":
+        return " & ".join(f"{word}:*" for word in words)
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def filter_matching(posts, query):
+    """Narrow the posts to all matches of the query, without the limit
+    and the cache of ranked_ids(); None where there is no index to ask
+    """
+    words = terms(query)
+    if not words or connection.vendor not in MATCHES:
+        return None
+    table = connection.ops.quote_name(Post._meta.db_table)
+    return posts.extra(
+        where=[f'{table}."id" IN ({MATCHES[connection.vendor]})'],
+        params=[match_expression(words)],
+    )
+
+
+def ranked_ids(query):
+    """Ids of the best SEARCH_RESULTS_LIMIT matches, best first"""
+    words = terms(query)
+    if not words or connection.vendor not in QUERIES:
+        return []
+    key = "search:" + digest(*words)
+    ids = cache.get(key)
+    if ids is None:
+        expression = match_expression(words)
+        params = [expression] * (2 if connection.vendor == "postgresql" else 1)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                QUERIES[connection.vendor],
+                params + [settings.SEARCH_RESULTS_LIMIT],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+        cache.set(key, ids, settings.SEARCH_CACHE_TIMEOUT)
+    return ids
@@ -0,0 +1,110 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import (
+    conditional, counters, follows, page_cache, search, thumbnails, timeline)
+from .models import AuthorStats, Comment, Follow, Group, Post, User
+
+
+@receiver(post_save, sender=Post)
+def post_created(sender, instance, created, **kwargs):
+    if created:
+        AuthorStats.objects.bump(instance.author_id, posts_count=1)
+        timeline.fan_out(instance)
+    replaced = getattr(instance, "loaded_image", None)
+    if replaced and replaced != instance.image.name:
+        transaction.on_commit(lambda: thumbnails.release(replaced))
+    instance.loaded_image = instance.image.name
+    search.index_post(instance.pk)
+    page_cache.forget_post_pages(instance)
+    conditional.touch_post_pages(instance, created)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    AuthorStats.objects.bump(instance.author_id, posts_count=-1)
+    transaction.on_commit(lambda: thumbnails.release(instance.image.name))
+    page_cache.forget_post_pages(instance)
+    conditional.touch_groups(instance.group_id)
+
+
+def comments_added(post_id, texts):
+    """Also called for comments inserted in bulk, see write_behind"""
+    counters.bump_comments(post_id, len(texts))
+    search.add_comments(post_id, texts)
+    page_cache.forget_comment_pages(post_id)
+    conditional.touch_comment_pages(post_id)
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, **kwargs):
+    if created:
+        comments_added(instance.post_id, [instance.text])
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.bump_comments(instance.post_id, -1)
+    # Deferred, as the post itself may be on its way out
+    transaction.on_commit(lambda: search.index_post(instance.post_id))
+    page_cache.forget_comment_pages(instance.post_id)
+    conditional.touch_comment_pages(instance.post_id)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        AuthorStats.objects.bump(instance.author_id, followers_count=1)
+        AuthorStats.objects.bump(instance.user_id, following_count=1)
+        follows.forget_following(instance.user_id)
+        timeline.backfill(instance.user_id, instance.author_id)
+        page_cache.forget_profile_pages(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    AuthorStats.objects.bump(instance.author_id, followers_count=-1)
+    AuthorStats.objects.bump(instance.user_id, following_count=-1)
+    follows.forget_following(instance.user_id)
+    timeline.prune(instance.user_id, instance.author_id)
+    timeline.follower_lost(instance.author_id)
+    page_cache.forget_profile_pages(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, **kwargs):
+    if not created:
+        instance.posts.update(version=F("version") + 1)
+        search.index_posts(instance.posts.all())
+        page_cache.bump(page_cache.ALL)
+        conditional.touch_group_authors(instance)
+
+
+NAME_FIELDS = ("username", "first_name", "last_name")
+
+
+def user_names(user):
+    return {name: user.__dict__.get(name) for name in NAME_FIELDS}
+
+
+@receiver(post_init, sender=User)
+def user_loaded(sender, instance, **kwargs):
+    # Lets user_saved tell which names an edit changed
+    instance.loaded_names = user_names(instance)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    loaded, instance.loaded_names = instance.loaded_names, user_names(instance)
+    page_cache.bump(f"profile:{instance.username}")
+    if not created and loaded["username"] != instance.username:
+        # Cards and pages everywhere link to the old name
+        instance.posts.update(version=F("version") + 1)
+        page_cache.bump(page_cache.ALL, f"profile:{loaded['username']}")
+    if not created and loaded != instance.loaded_names:
+        posts = instance.posts.all()
+        # An author may have many posts, their documents can wait
+        transaction.on_commit(lambda: search.index_posts(posts))
+        conditional.touch_author_pages(instance)
@@ -0,0 +1,90 @@
+"""Snowball stemmer for Russian.
+
+A plain port of https://snowballstem.org/algorithms/russian/stemmer.html
+so that the search index does not depend on the database's dictionaries
+or an extra package. Words are expected in lower case with ё replaced.
+"""
+from functools import lru_cache
+
+VOWELS = "аеиоуыэюя"
+
+PERFECTIVE_GERUND = (("в", "вши", "вшись"),
+                     ("ив", "ивши", "ившись", "ыв", "ывши", "ывшись"))
+ADJECTIVE = ((), ("ее", "ие", "ые", "ое", "ими", "ыми", "ей", "ий", "ый",
+                  "ой", "ем", "им", "ым", "ом", "его", "ого", "ему", "ому",
+                  "их", "ых", "ую", "юю", "ая", "яя", "ою", "ею"))
+PARTICIPLE = (("ем", "нн", "вш", "ющ", "щ"), ("ивш", "ывш", "ующ"))
+REFLEXIVE = ((), ("ся", "сь"))
+VERB = (("ла", "на", "ете", "йте", "ли", "й", "л", "ем", "н", "ло", "но",
+         "ет", "ют", "ны", "ть", "ешь", "нно"),
+        ("ила", "ыла", "ена", "ейте", "уйте", "ите", "или", "ыли", "ей",
+         "уй", "ил", "ыл", "им", "ым", "ен", "ило", "ыло", "ено", "ят",
+         "ует", "уют", "ит", "ыт", "ены", "ить", "ыть", "ишь", "ую", "ю"))
+NOUN = ((), ("а", "ев", "ов", "ие", "ье", "е", "иями", "ями", "ами", "еи",
+             "ии", "и", "ией", "ей", "ой", "ий", "й", "иям", "ям", "ием",
+             "ем", "ам", "ом", "о", "у", "ах", "иях", "ях", "ы", "ь", "ию",
+             "ью", "ю", "ия", "ья", "я"))
+SUPERLATIVE = ((), ("ейше", "ейш"))
+DERIVATIONAL = ((), ("ость", "ост"))
+
+
+def region(word, start=0):
+    """Index after the first non-vowel that follows a vowel"""
+    for i in range(start + 1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            return i + 1
+    return len(word)
+
+
+def strip(word, start, endings):
+    """Remove the longest of the endings lying after start, or None.
+
+    endings is a pair: the first group only counts after а or я,
+    which stay in place.
+    """
+    after_a, plain = endings
+    found = max(
+        (ending for ending in after_a + plain if word.endswith(ending)
+         and len(word) - len(ending) >= start),
+        key=len, default=None)
+    if found is None:
+        return None
+    stem = word[:-len(found)]
+    if found in plain:
+        return stem
+    if len(stem) - 1 >= start and stem[-1] in "ая":
+        return stem
+    return None
+
+
+@lru_cache(maxsize=100_000)
+def stem(word):
+    rv = next((i + 1 for i, c in enumerate(word) if c in VOWELS), len(word))
+    r2 = region(word, region(word))
+    # Step 1
+    stripped = strip(word, rv, PERFECTIVE_GERUND)
+    if stripped is None:
+        word = strip(word, rv, REFLEXIVE) or word
+        stripped = strip(word, rv, ADJECTIVE)
+        if stripped is not None:
+            stripped = strip(stripped, rv, PARTICIPLE) or stripped
+        else:
+            stripped = strip(word, rv, VERB) or strip(word, rv, NOUN)
+    word = stripped if stripped is not None else word
+    # Step 2
+    if word.endswith("и") and len(word) - 1 >= rv:
+        word = word[:-1]
+    # Step 3
+    word = strip(word, max(r2, rv), DERIVATIONAL) or word
+    # Step 4
+    if word.endswith("нн") and len(word) - 2 >= rv:
+        return word[:-1]
+    stripped = strip(word, rv, SUPERLATIVE)
+    if stripped is not None:
+        word = stripped
+        if word.endswith("нн") and len(word) - 2 >= rv:
+            word = word[:-1]
+        return word
+    if word.endswith("ь") and len(word) - 1 >= rv:
+        return word[:-1]
+    return word
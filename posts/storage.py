@@ -0,0 +1,43 @@
+"""Content-addressed storage for post images.
+
+Files are named after the SHA-256 of their content and sharded by its
+first bytes, e.g. posts/ab/cd/abcd....jpg, so an image uploaded many
+times is stored once and its thumbnails are shared by every post using
+it. Files are removed by thumbnails.release() when the last post
+referring to them goes, unless an upload wrote or reused them within
+POST_IMAGE_RELEASE_GRACE seconds.
+"""
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    def content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        hexdigest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(
+            os.path.dirname(name),
+            hexdigest[:2],
+            hexdigest[2:4],
+            hexdigest + extension,
+        )
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        if self.exists(name):
+            # Keeps thumbnails.release() from deleting it under this upload
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length)
@@ -0,0 +1,60 @@
+from django import template
+from django.template.base import token_kwargs
+
+from posts import follows, page_cache, write_behind
+
+register = template.Library()
+
+
+class HoleNode(template.Node):
+
+    def __init__(self, template_name, extra_context):
+        self.template_name = template_name
+        self.extra_context = extra_context
+
+    def render(self, context):
+        values = {
+            name: value.resolve(context)
+            for name, value in self.extra_context.items()
+        }
+        return page_cache.render_hole(
+            context.get("request"),
+            self.template_name.resolve(context),
+            values,
+        )
+
+
+@register.tag
+def hole(parser, token):
+    """Include a template that depends on the viewer.
+
+    {% hole "includes/nav.html" %} or
+    {% hole "includes/post_link.html" post_id=post.id ... %}
+
+    In a cached page only the arguments are stored and the template is
+    rendered for each viewer, so it sees nothing but the arguments and the
+    context processors. Arguments should be plain values.
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(
+            f"{bits[0]!r} tag takes the name of a template")
+    extra_context = token_kwargs(bits[2:], parser, support_legacy=False)
+    if len(extra_context) != len(bits) - 2:
+        raise template.TemplateSyntaxError(
+            f"{bits[0]!r} tag only takes name=value arguments")
+    return HoleNode(parser.compile_filter(bits[1]), extra_context)
+
+
+@register.simple_tag(takes_context=True)
+def follows_author(context, author_id):
+    queued = write_behind.pending_follow(context["request"], author_id)
+    if queued is not None:
+        return queued
+    return follows.follows_author(context["user"], author_id)
+
+
+@register.simple_tag(takes_context=True)
+def pending_comments(context, post_id):
+    """The viewer's comments on the post that are not stored yet"""
+    return write_behind.pending_comments(context["request"], post_id)
@@ -0,0 +1,25 @@
+from django import template
+from django.conf import settings
+
+from posts import thumbnails
+
+register = template.Library()
+
+
+@register.filter
+def srcset(images):
+    """Format [(url, width), ...] as an srcset attribute value"""
+    return ", ".join(f"{url} {width}w" for url, width in images)
+
+
+@register.inclusion_tag("includes/post_image.html")
+def post_image(post):
+    sources = thumbnails.sources(post)
+    width, height = settings.POST_IMAGE_ASPECT
+    return {
+        "post": post,
+        "sources": sources[:-1],
+        "fallback": sources[-1][1] if sources else None,
+        "width": width,
+        "height": height,
+    }
@@ -1,17 +1,38 @@
 
 import io
+import json
+import os
+import shutil
 import tempfile
 from dummy_file_generator import DummyFileGenerator
+from PIL import Image
 from django.contrib.auth.models import AnonymousUser
-from django.core.cache import cache
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.http import HttpResponse
+from django.test import (Client, RequestFactory, TestCase,
+                         TransactionTestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-from posts.models import Follow, Group, Post, User
+from posts import (admin, api, comments, counters, follows, page_cache,
+                   thumbnails, timeline, transfer, write_behind)
+from posts.models import (AuthorStats, Comment, Follow, Group, Post,
+                          SearchDocument, TimelineEntry, User)
+from yatube.settings import cache_settings
 
 
-class TestPostsApp(TestCase):
+def clear_caches():
+    for alias in settings.CACHES:
+        caches[alias].clear()
+
+
+class TestPostsApp(TransactionTestCase):
+    """ Caches are invalidated on commit, hence the TransactionTestCase"""
 
     def setUp(self):
         self.client_anon = Client()
@@ -22,7 +43,7 @@ class TestPostsApp(TestCase):
         self.client_auth.force_login(self.author)
 
     def tearDown(self):
-        cache.clear()
+        clear_caches()
 
     def test_anon_user_post(self):
         """ Testing if an unauthorized user can create a post"""
@@ -143,18 +164,22 @@ class TestPostsApp(TestCase):
             )
 
     def test_index_cache(self):
-        """ Testing cache function will store an info"""
+        """ Testing cache function will store an info
+        until a new post is published
+        """
         response_1 = self.client_auth.get(reverse("index"))
+        # Only the user is loaded on a cache hit, the session is cached
+        with self.assertNumQueries(1):
+            response_2 = self.client_auth.get(reverse("index"))
+        self.assertEqual(response_1.content, response_2.content)
         Post.objects.create(
             author=self.author,
             group=self.group,
             text=self.text,
         )
-        response_2 = self.client_auth.get(reverse("index"))
-        self.assertEqual(response_1.content, response_2.content)
-        cache.clear()
         response_3 = self.client_auth.get(reverse("index"))
         self.assertNotEqual(response_1.content, response_3.content)
+        self.assertContains(response_3, self.text)
 
     def test_auth_user_subscribe_process(self):
         """ Testing subscribe system allow to follow/unfollow a user"""
@@ -163,7 +188,7 @@ class TestPostsApp(TestCase):
             "profile_follow", args=[author.username]))
         self.client_auth.get(reverse(
             "profile", args=[author.username]))
-        follower = User.objects.get(pk=1)
+        follower = User.objects.get(username=self.author.username)
         self.assertTrue(
             Follow.objects.filter(user=follower, author=author).exists())
         self.client_auth.post(reverse(
@@ -217,6 +242,1340 @@ class TestPostsApp(TestCase):
         self.assertEqual(response.context['comments'][0].post.id, post.id)
 
 
+class TestFeedQueries(TestCase):
+
+    def setUp(self):
+        self.client_auth = Client()
+        self.author = User.objects.create_user(username="Author")
+        self.reader = User.objects.create_user(username="Reader")
+        self.group = Group.objects.create(title="Тестовая группа", slug="test")
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.client_auth.force_login(self.reader)
+
+    def tearDown(self):
+        clear_caches()
+
+    def add_posts(self, count):
+        for i in range(count):
+            post = Post.objects.create(
+                text=f"Текст {i}",
+                author=self.author,
+                group=self.group,
+            )
+            Comment.objects.create(post=post, author=self.reader, text="Ок")
+
+    def count_queries(self, url):
+        clear_caches()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client_auth.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_feed_query_count_does_not_depend_on_page_size(self):
+        """ Checking every feed page costs a fixed number of queries"""
+        urls = (
+            reverse("index"),
+            reverse("group", args=[self.group.slug]),
+            reverse("profile", args=[self.author.username]),
+            reverse("follow_index"),
+        )
+        self.add_posts(1)
+        small = {url: self.count_queries(url) for url in urls}
+        self.add_posts(9)
+        for url in urls:
+            with self.subTest("Число запросов растёт с размером " + url):
+                self.assertEqual(small[url], self.count_queries(url))
+
+
+@override_settings(POSTS_CURSOR_PAGINATION=("index",))
+class TestCursorPagination(TestCase):
+
+    def setUp(self):
+        self.client = Client()
+        self.author = User.objects.create_user(username="Author")
+        for i in range(25):
+            Post.objects.create(text=f"Текст {i}", author=self.author)
+        self.expected = list(Post.objects.order_by("-pub_date", "-id"))
+
+    def tearDown(self):
+        clear_caches()
+
+    def get_page(self, query=""):
+        clear_caches()
+        return self.client.get(reverse("index") + query).context["page"]
+
+    def test_cursor_walks_whole_feed_both_ways(self):
+        """ Checking next/previous cursors visit every post once"""
+        pages = [self.get_page()]
+        while pages[-1].has_next():
+            pages.append(self.get_page(f"?cursor={pages[-1].next_cursor}"))
+        seen = [post for page in pages for post in page]
+        self.assertEqual(seen, self.expected)
+        self.assertFalse(pages[0].has_previous())
+        back = self.get_page(f"?cursor={pages[-1].previous_cursor}")
+        self.assertEqual(list(back), list(pages[-2]))
+
+    def test_old_page_links_still_work(self):
+        """ Checking ?page=N serves the same posts as the cursor walk"""
+        second = self.get_page("?page=2")
+        self.assertEqual(list(second), self.expected[10:20])
+        first = self.get_page(f"?cursor={second.previous_cursor}")
+        self.assertEqual(list(first), self.expected[:10])
+
+    def test_broken_cursor_falls_back_to_first_page(self):
+        page = self.get_page("?cursor=garbage")
+        self.assertEqual(list(page), self.expected[:10])
+
+
+class TestTimeline(TestCase):
+
+    def setUp(self):
+        self.client_auth = Client()
+        self.author = User.objects.create_user(username="Author")
+        self.reader = User.objects.create_user(username="Reader")
+        self.client_auth.force_login(self.reader)
+
+    def feed(self):
+        response = self.client_auth.get(reverse("follow_index"))
+        return list(response.context["page"])
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        """ Checking the timeline follows subscriptions"""
+        post = Post.objects.create(text="Текст", author=self.author)
+        self.client_auth.get(
+            reverse("profile_follow", args=[self.author.username]))
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post=post).exists())
+        self.assertEqual(self.feed(), [post])
+        self.client_auth.get(
+            reverse("profile_unfollow", args=[self.author.username]))
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(self.feed(), [])
+
+    def test_new_post_is_fanned_out(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(text="Текст", author=self.author)
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post=post).exists())
+        self.assertEqual(self.feed(), [post])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=2)
+    def test_popular_author_is_merged_on_read(self):
+        """ Checking posts of popular authors are not copied
+        but still shown in the subscription feed
+        """
+        fan = User.objects.create_user(username="Fan")
+        Follow.objects.create(user=fan, author=self.author)
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(text="Текст", author=self.author)
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(self.feed(), [post])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=2)
+    def test_author_dropping_below_the_limit_is_backfilled(self):
+        fan = User.objects.create_user(username="Fan")
+        Follow.objects.create(user=fan, author=self.author)
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(text="Текст", author=self.author)
+        Follow.objects.filter(user=fan).delete()
+        # Left to the worker, the posts are merged on read meanwhile
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(self.feed(), [post])
+        call_command("rebuild_timelines", pending=True, stdout=io.StringIO())
+        self.assertFalse(AuthorStats.objects.get(
+            user=self.author).backfill_pending)
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post=post).exists())
+        self.assertEqual(list(timeline.timeline_posts(self.reader)), [post])
+        self.assertEqual(self.feed(), [post])
+
+
+class TestCounters(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(username="Author")
+        self.reader = User.objects.create_user(username="Reader")
+
+    def stats(self, user):
+        return AuthorStats.objects.get(user=user)
+
+    def test_counters_follow_creates_and_deletes(self):
+        """ Checking counters are kept in step with the rows"""
+        post = Post.objects.create(text="Текст", author=self.author)
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text="Ок")
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+        comment.delete()
+        follow.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 0)
+        self.assertEqual(self.stats(self.author).followers_count, 0)
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+
+    def test_deleting_a_user_leaves_no_stats_behind(self):
+        """ Checking the cascade does not recreate the deleted user's stats"""
+        post = Post.objects.create(text="Текст", author=self.author)
+        own = Post.objects.create(text="Свой", author=self.reader)
+        Comment.objects.create(post=post, author=self.author, text="Ок")
+        Comment.objects.create(post=own, author=self.author, text="Ок")
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=self.author, author=self.reader)
+        self.author.delete()
+        connection.check_constraints()
+        self.assertFalse(AuthorStats.objects.filter(
+            user_id=self.author.pk).exists())
+        self.assertEqual(self.stats(self.reader).followers_count, 0)
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+        own.refresh_from_db()
+        self.assertEqual(own.comment_count, 0)
+
+    def test_reconcile_repairs_drift(self):
+        post = Post.objects.create(text="Текст", author=self.author)
+        Post.objects.update(comment_count=7)
+        AuthorStats.objects.filter(user=self.author).update(posts_count=3)
+        self.assertEqual(counters.reconcile(), (1, 1))
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 0)
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(counters.reconcile(), (0, 0))
+
+
+class TestFollowButton(TransactionTestCase):
+    """ Caches are invalidated on commit, hence the TransactionTestCase"""
+
+    def setUp(self):
+        self.client_auth = Client()
+        self.author = User.objects.create_user(username="Author")
+        self.reader = User.objects.create_user(username="Reader")
+        self.client_auth.force_login(self.reader)
+
+    def tearDown(self):
+        clear_caches()
+
+    def test_button_depends_on_viewer_not_follower_count(self):
+        """ Checking the viewer sees "Подписаться" while others follow"""
+        fan = User.objects.create_user(username="Fan")
+        Follow.objects.create(user=fan, author=self.author)
+        url = reverse("profile", args=[self.author.username])
+        response = self.client_auth.get(url)
+        self.assertContains(response, "Подписаться")
+        Follow.objects.create(user=self.reader, author=self.author)
+        response = self.client_auth.get(url)
+        self.assertContains(response, "Отписаться")
+
+    def test_follow_set_is_cached_until_follow_changes(self):
+        self.assertFalse(follows.is_following(self.reader, self.author))
+        with self.assertNumQueries(0):
+            follows.is_following(self.reader, self.author)
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertTrue(follows.is_following(self.reader, self.author))
+
+    def test_duplicate_follow_is_rejected(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Follow.objects.create(user=self.reader, author=self.author)
+
+    @override_settings(FOLLOW_SET_LIMIT=0)
+    def test_large_follow_sets_use_exists(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertTrue(follows.is_following(self.reader, self.author))
+        with self.assertNumQueries(1):
+            follows.is_following(self.reader, self.author)
+
+
+class TestPostCardCache(TransactionTestCase):
+    """ Caches are invalidated on commit, hence the TransactionTestCase"""
+
+    def setUp(self):
+        self.client_auth = Client()
+        self.author = User.objects.create_user(username="Author")
+        self.client_auth.force_login(self.author)
+        self.post = Post.objects.create(
+            text="Старый текст", author=self.author)
+        self.url = reverse("profile", args=[self.author.username])
+
+    def tearDown(self):
+        clear_caches()
+
+    def test_card_is_served_from_cache_until_version_changes(self):
+        """ Checking cards are re-rendered only after a version bump"""
+        self.client_auth.get(self.url)
+        Post.objects.update(text="Новый текст")
+        page_cache.bump(page_cache.ALL)
+        self.assertContains(self.client_auth.get(self.url), "Старый текст")
+        self.post.bump_version()
+        page_cache.bump(page_cache.ALL)
+        self.assertContains(self.client_auth.get(self.url), "Новый текст")
+
+    def test_edit_and_comment_bump_version(self):
+        self.client_auth.post(
+            reverse("post_edit", args=[self.author.username, self.post.pk]),
+            {"text": "Новый текст"},
+        )
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.version, 2)
+        Comment.objects.create(post=self.post, author=self.author, text="Ок")
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.version, 3)
+        self.assertEqual(self.post.comment_count, 1)
+
+    def test_edit_link_is_not_cached(self):
+        edit_url = reverse(
+            "post_edit", args=[self.author.username, self.post.pk])
+        self.assertContains(self.client_auth.get(self.url), edit_url)
+        self.assertNotContains(Client().get(self.url), edit_url)
+
+
+class TestPageCache(TransactionTestCase):
+    """ Caches are invalidated on commit, hence the TransactionTestCase"""
+
+    def setUp(self):
+        self.author = User.objects.create_user(username="Author")
+        self.reader = User.objects.create_user(username="Reader")
+        self.group = Group.objects.create(title="Группа", slug="test")
+        self.post = Post.objects.create(
+            text="Текст", author=self.author, group=self.group)
+        self.urls = (
+            reverse("index"),
+            reverse("group", args=[self.group.slug]),
+            reverse("profile", args=[self.author.username]),
+        )
+
+    def tearDown(self):
+        clear_caches()
+
+    def test_hits_keep_the_headers_of_the_page(self):
+        """ Checking a cached page is served with the view's headers"""
+        @page_cache.cached_page()
+        def view(request):
+            response = HttpResponse(
+                "Страница", content_type="text/plain; charset=utf-8")
+            response["Content-Language"] = "ru"
+            return response
+
+        request = RequestFactory().get("/headers/")
+        request.user = AnonymousUser()
+        miss, hit = view(request), view(request)
+        self.assertEqual(hit.content, miss.content)
+        self.assertEqual(dict(hit.items()), dict(miss.items()))
+        self.assertEqual(hit["Content-Type"], "text/plain; charset=utf-8")
+
+    def assert_all_pages_contain(self, text):
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.assertContains(Client().get(url), text)
+
+    def test_pages_are_invalidated_by_writes(self):
+        """ Checking edits and comments show up immediately"""
+        for url in self.urls:
+            Client().get(url)
+        self.post.text = "Исправленный текст"
+        self.post.save()
+        self.assert_all_pages_contain("Исправленный текст")
+        Comment.objects.create(post=self.post, author=self.reader, text="Ок")
+        self.assert_all_pages_contain("Комментариев: 1")
+
+    def test_renamed_author_leaves_every_page(self):
+        for url in self.urls:
+            Client().get(url)
+        self.author.username = "Renamed"
+        self.author.save()
+        for url in self.urls[:2]:
+            with self.subTest(url=url):
+                response = Client().get(url)
+                self.assertContains(response, "@Renamed")
+                self.assertNotContains(response, "/Author/")
+
+    def test_moved_post_leaves_old_group_page(self):
+        url = reverse("group", args=[self.group.slug])
+        self.assertContains(Client().get(url), "Текст")
+        post = Post.objects.get(pk=self.post.pk)
+        post.group = Group.objects.create(title="Другая", slug="other")
+        post.save()
+        self.assertNotContains(Client().get(url), "Текст")
+
+    def test_stale_page_is_served_while_another_request_renders(self):
+        url = reverse("index")
+        Client().get(url)
+        Post.objects.create(text="Свежая запись", author=self.author)
+        names = [page_cache.ALL, "index"]
+        key = "page:" + page_cache.digest(
+            page_cache.digest(url), *page_cache.get_versions(names))
+        caches["pages"].add(key + ":lock", 1)
+        with self.assertNumQueries(0):
+            response = Client().get(url)
+        self.assertNotContains(response, "Свежая запись")
+        caches["pages"].delete(key + ":lock")
+        self.assertContains(Client().get(url), "Свежая запись")
+
+
+class TestPageHoles(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(username="Author")
+        self.reader = User.objects.create_user(username="Reader")
+        self.post = Post.objects.create(text="Текст", author=self.author)
+        self.urls = (
+            reverse("index"),
+            reverse("profile", args=[self.author.username]),
+            reverse("post", args=[self.author.username, self.post.pk]),
+        )
+
+    def tearDown(self):
+        clear_caches()
+
+    def client_for(self, user):
+        client = Client()
+        client.force_login(user)
+        return client
+
+    def test_logged_in_viewers_hit_the_shared_page(self):
+        """ Checking a page cached for anyone is filled in for the reader"""
+        Client().get(self.urls[0])
+        client = self.client_for(self.reader)
+        # Only the reader themself is loaded
+        with self.assertNumQueries(1):
+            response = client.get(self.urls[0])
+        self.assertContains(response, "Пользователь: Reader")
+        self.assertContains(response, "csrfmiddlewaretoken")
+        response = Client().get(self.urls[0])
+        self.assertNotContains(response, "Reader")
+        self.assertNotContains(response, "csrfmiddlewaretoken")
+
+    def test_stored_pages_are_anonymous(self):
+        client = self.client_for(self.author)
+        edit_url = reverse("post_edit", args=["Author", self.post.pk])
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.assertContains(client.get(url), "Пользователь: Author")
+                content, holes, _ = caches["pages"].get(
+                    "page-stale:" + page_cache.digest(url))
+                self.assertNotIn("Пользователь".encode(), content)
+                self.assertNotIn(edit_url.encode(), content)
+                self.assertIn(page_cache.HOLE.format(0).encode(), content)
+                self.assertEqual(holes[0], ("includes/nav.html", {}))
+
+    def test_controls_depend_on_the_viewer(self):
+        edit_url = reverse("post_edit", args=["Author", self.post.pk])
+        for url in self.urls:
+            with self.subTest(url=url):
+                Client().get(url)
+                self.assertContains(
+                    self.client_for(self.author).get(url), edit_url)
+                self.assertNotContains(
+                    self.client_for(self.reader).get(url), edit_url)
+        profile = self.client_for(self.reader).get(self.urls[1])
+        self.assertContains(profile, "Подписаться")
+        profile = self.client_for(self.author).get(self.urls[1])
+        self.assertNotContains(profile, "Подписаться")
+
+    def test_holes_render_in_place_outside_the_cache(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        response = self.client_for(self.reader).get(reverse("follow_index"))
+        self.assertContains(response, "Пользователь: Reader")
+        self.assertNotContains(response, "<!--hole:")
+
+
+@override_settings(COMMENTS_PER_PAGE=3, FEED_COMMENTS=2)
+class TestCommentWindows(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(username="Author")
+        self.post = Post.objects.create(text="Текст", author=self.author)
+        self.other = Post.objects.create(text="Другой", author=self.author)
+        self.comments = [
+            Comment.objects.create(
+                post=self.post, author=self.author, text=f"Комментарий {i}")
+            for i in range(7)
+        ]
+        Comment.objects.create(
+            post=self.other, author=self.author, text="Единственный")
+
+    def tearDown(self):
+        clear_caches()
+
+    def test_feed_shows_latest_comments_in_one_query(self):
+        """ Checking the index fetches N comments per post with a window"""
+        posts = list(Post.objects.for_feed())
+        with self.assertNumQueries(1):
+            comments.attach_latest(posts)
+        latest = {post.pk: post.latest_comments for post in posts}
+        self.assertEqual(latest[self.post.pk], self.comments[:-3:-1])
+        self.assertEqual([c.text for c in latest[self.other.pk]],
+                         ["Единственный"])
+        response = Client().get(reverse("index"))
+        self.assertContains(response, "Комментарий 6")
+        self.assertNotContains(response, "Комментарий 4")
+        self.assertContains(response, "Показать ещё комментарии", count=1)
+
+    def walk_comments(self):
+        url = reverse("post", args=[self.author.username, self.post.pk])
+        response = Client().get(url)
+        seen = [item.text for item in response.context["comments"]]
+        cursor = response.context["comments_cursor"]
+        more_url = reverse(
+            "post_comments", args=[self.author.username, self.post.pk])
+        while cursor:
+            response = Client().get(more_url, {"cursor": cursor})
+            seen += [item.text for item in response.context["comments"]]
+            cursor = response.context["cursor"]
+        return seen
+
+    def test_load_more_walks_through_all_comments(self):
+        self.assertEqual(self.walk_comments(),
+                         [comment.text for comment in reversed(self.comments)])
+
+    @override_settings(COMMENTS_PER_PAGE=3)
+    def test_comments_written_at_once_are_all_shown(self):
+        """ Checking equal dates, as from a bulk insert, are paged by id"""
+        Comment.objects.filter(post=self.post).update(
+            created=self.comments[0].created)
+        self.assertEqual(self.walk_comments(),
+                         [comment.text for comment in reversed(self.comments)])
+
+    def test_load_more_needs_the_right_author(self):
+        url = reverse("post_comments", args=["Someone", self.post.pk])
+        self.assertEqual(Client().get(url).status_code, 404)
+
+
+SMALL_GIF = (
+    b"\x47\x49\x46\x38\x39\x61\x01\x00\x01\x00\x00\x00\x00\x21\xf9\x04"
+    b"\x01\x0a\x00\x01\x00\x2c\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02"
+    b"\x02\x4c\x01\x00\x3b"
+)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class TestThumbnails(TransactionTestCase):
+    """ Caches are invalidated on commit, hence the TransactionTestCase"""
+
+    def setUp(self):
+        self.client_auth = Client()
+        self.author = User.objects.create_user(username="Author")
+        self.client_auth.force_login(self.author)
+        self.url = reverse("profile", args=[self.author.username])
+
+    def tearDown(self):
+        clear_caches()
+
+    def upload(self, url, name):
+        image = SimpleUploadedFile(name, SMALL_GIF, "image/gif")
+        self.client_auth.post(url, {"text": "Текст", "image": image})
+        return Post.objects.get(author=self.author)
+
+    def test_placeholder_until_worker_renders_thumbnails(self):
+        """ Checking uploads are resized by the worker, not the request"""
+        post = self.upload(reverse("new_post"), "some.gif")
+        self.assertFalse(post.thumbnails_ready)
+        response = self.client_auth.get(self.url)
+        self.assertContains(response, "Изображение обрабатывается")
+        call_command("process_thumbnails", stdout=io.StringIO())
+        post.refresh_from_db()
+        self.assertTrue(post.thumbnails_ready)
+        # A browser revalidating the page with the placeholder gets the image
+        response = self.client_auth.get(
+            self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, "Изображение обрабатывается")
+        self.assertContains(response, "/media/cache/")
+
+    def test_replaced_image_is_queued_again(self):
+        post = self.upload(reverse("new_post"), "some.gif")
+        call_command("process_thumbnails", stdout=io.StringIO())
+        post = self.upload(
+            reverse("post_edit", args=[self.author.username, post.pk]),
+            "other.gif",
+        )
+        self.assertFalse(post.thumbnails_ready)
+        self.assertIn(post, thumbnails.pending())
+
+    def test_responsive_variants(self):
+        """ Checking every width is offered in WebP with a JPEG fallback"""
+        self.upload(reverse("new_post"), "some.gif")
+        call_command("process_thumbnails", stdout=io.StringIO())
+        response = self.client_auth.get(self.url)
+        self.assertContains(response, '<source type="image/webp"')
+        content = response.content.decode()
+        for width in settings.POST_IMAGE_WIDTHS:
+            self.assertRegex(content, rf"\.webp {width}w")
+            self.assertRegex(content, rf"\.jpg {width}w")
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class TestUploads(TestCase):
+
+    def setUp(self):
+        self.client_auth = Client()
+        self.author = User.objects.create_user(username="Author")
+        self.client_auth.force_login(self.author)
+
+    def tearDown(self):
+        clear_caches()
+
+    def post_image(self, content, name="photo.jpg"):
+        image = SimpleUploadedFile(name, content, "image/jpeg")
+        return self.client_auth.post(
+            reverse("new_post"), {"text": "Текст", "image": image})
+
+    def jpeg(self, size=(50, 50), **options):
+        file = io.BytesIO()
+        Image.new("RGB", size, "red").save(file, "JPEG", **options)
+        return file.getvalue()
+
+    @override_settings(POST_IMAGE_MAX_BYTES=100)
+    def test_oversized_upload_is_cut_off(self):
+        """ Checking files over the size limit are rejected"""
+        response = self.post_image(self.jpeg())
+        self.assertFormError(
+            response, "form", "image", "Файл слишком большой, максимум 0 МБ.")
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=100)
+    def test_pixel_limit(self):
+        """ Checking pictures are rejected by their dimensions"""
+        response = self.post_image(self.jpeg())
+        self.assertFormError(
+            response, "form", "image",
+            "Изображение слишком большое, максимум 100 пикселей.")
+
+    @override_settings(POST_IMAGE_MAX_SIDE=20)
+    def test_reencoded_without_exif(self):
+        """ Checking stored images lose EXIF and are scaled down"""
+        exif = Image.Exif()
+        exif[0x010F] = "Camera"
+        self.post_image(self.jpeg(exif=exif.tobytes()))
+        with Image.open(Post.objects.get().image) as image:
+            self.assertEqual(image.size, (20, 20))
+            self.assertNotIn("exif", image.info)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), POST_IMAGE_RELEASE_GRACE=0)
+class TestImageStorage(TransactionTestCase):
+    """ Files are released on commit, hence the TransactionTestCase"""
+
+    def setUp(self):
+        self.author = User.objects.create_user(username="Author")
+
+    def tearDown(self):
+        clear_caches()
+
+    def create(self, content=SMALL_GIF):
+        return Post.objects.create(
+            author=self.author, text="Текст",
+            image=SimpleUploadedFile("some.gif", content, "image/gif"))
+
+    def test_identical_uploads_share_a_file(self):
+        """ Checking an image is stored once and kept while in use"""
+        first, second = self.create(), self.create()
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, r"^posts/\w\w/\w\w/\w{64}\.gif$")
+        storage = first.image.storage
+        first.delete()
+        self.assertTrue(storage.exists(second.image.name))
+        second.delete()
+        self.assertFalse(storage.exists(second.image.name))
+
+    def test_replaced_image_is_deleted(self):
+        post = self.create()
+        old_name = post.image.name
+        post.image = SimpleUploadedFile(
+            "other.gif", SMALL_GIF + b"\0", "image/gif")
+        post.save()
+        self.assertNotEqual(old_name, post.image.name)
+        self.assertFalse(post.image.storage.exists(old_name))
+
+    @override_settings(POST_IMAGE_RELEASE_GRACE=600)
+    def test_file_reused_by_an_upload_is_kept(self):
+        """ Checking a release does not delete a file an upload just reused"""
+        post = self.create()
+        name = post.image.name
+        storage = post.image.storage
+        os.utime(storage.path(name), (0, 0))
+        # Another upload of the same bytes, its post not committed yet
+        again = storage.save("posts/again.gif", io.BytesIO(SMALL_GIF))
+        self.assertEqual(again, name)
+        Post.objects.filter(pk=post.pk).delete()
+        thumbnails.release(name)
+        self.assertTrue(storage.exists(name))
+
+
+class TestWriteBehind(TransactionTestCase):
+    """ The queue is removed on commit, hence the TransactionTestCase"""
+
+    def setUp(self):
+        self.queue = tempfile.mkdtemp()
+        self.settings = override_settings(WRITE_BEHIND_DIR=self.queue)
+        self.settings.enable()
+        self.author = User.objects.create_user(username="Author")
+        self.reader = User.objects.create_user(username="Reader")
+        self.post = Post.objects.create(text="Текст", author=self.author)
+        self.client_auth = Client()
+        self.client_auth.force_login(self.reader)
+        self.post_url = reverse("post", args=["Author", self.post.pk])
+        self.profile_url = reverse("profile", args=["Author"])
+
+    def tearDown(self):
+        self.settings.disable()
+        clear_caches()
+
+    def comment(self, client, text):
+        client.post(reverse("add_comment", args=["Author", self.post.pk]),
+                    {"text": text})
+
+    def test_comments_are_queued_but_shown_to_their_author(self):
+        """ Checking a queued comment is visible to its author only"""
+        self.comment(self.client_auth, "Отложенный комментарий")
+        self.assertFalse(Comment.objects.exists())
+        self.assertContains(
+            self.client_auth.get(self.post_url), "Отложенный комментарий")
+        self.assertNotContains(
+            Client().get(self.post_url), "Отложенный комментарий")
+        call_command("flush_writes", stdout=io.StringIO())
+        self.assertEqual(Post.objects.get().comment_count, 1)
+        self.assertContains(
+            Client().get(self.post_url), "Отложенный комментарий")
+        self.assertEqual(os.listdir(os.path.join(
+            self.queue, str(self.reader.pk))), [])
+
+    def test_queued_writes_are_not_answered_with_304(self):
+        """ Checking the viewer's queued writes change the ETag"""
+        for url, write, shown in (
+            (self.post_url, lambda: self.comment(
+                self.client_auth, "Отложенный комментарий"),
+             "Отложенный комментарий"),
+            (self.profile_url, lambda: self.client_auth.get(
+                reverse("profile_follow", args=["Author"])), "Отписаться"),
+        ):
+            with self.subTest(url=url):
+                etag = self.client_auth.get(url)["ETag"]
+                write()
+                response = self.client_auth.get(
+                    url, HTTP_IF_NONE_MATCH=etag)
+                self.assertContains(response, shown)
+                response = self.client_auth.get(
+                    url, HTTP_IF_NONE_MATCH=response["ETag"])
+                self.assertEqual(response.status_code, 304)
+
+    def test_burst_is_inserted_in_one_statement(self):
+        clients = [self.client_auth]
+        for i in range(3):
+            clients.append(Client())
+            clients[-1].force_login(
+                User.objects.create_user(username=f"User{i}"))
+        for i in range(20):
+            self.comment(clients[i % len(clients)], f"Комментарий {i}")
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(write_behind.flush(), 20)
+        inserts = [query for query in queries
+                   if query["sql"].startswith('INSERT INTO "posts_comment"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(Comment.objects.count(), 20)
+
+    def test_follows_apply_in_order(self):
+        self.client_auth.get(reverse("profile_follow", args=["Author"]))
+        self.assertContains(self.client_auth.get(self.profile_url),
+                            "Отписаться")
+        self.client_auth.get(reverse("profile_unfollow", args=["Author"]))
+        self.assertContains(self.client_auth.get(self.profile_url),
+                            "Подписаться")
+        self.client_auth.get(reverse("profile_follow", args=["Author"]))
+        write_behind.flush()
+        self.assertTrue(Follow.objects.filter(user=self.reader).exists())
+        self.assertEqual(AuthorStats.objects.for_user(
+            self.author).followers_count, 1)
+
+    def test_follow_feed_flushes_the_viewers_queue(self):
+        self.client_auth.get(reverse("profile_follow", args=["Author"]))
+        response = self.client_auth.get(reverse("follow_index"))
+        self.assertContains(response, "Текст")
+
+    def test_repeated_comments_are_all_kept(self):
+        self.comment(self.client_auth, "+1")
+        self.comment(self.client_auth, "+1")
+        write_behind.flush(batch_size=1)
+        self.assertEqual(Comment.objects.filter(text="+1").count(), 2)
+
+    def test_flush_after_a_crash_does_not_duplicate(self):
+        self.comment(self.client_auth, "Один раз")
+        directory = os.path.join(self.queue, str(self.reader.pk))
+        name = os.listdir(directory)[0]
+        with open(os.path.join(directory, name)) as file:
+            queued = file.read()
+        write_behind.flush()
+        # The claim of a batch committed just before the worker died
+        claimed = name[:-len(write_behind.QUEUED)] + write_behind.CLAIMED
+        claimed = os.path.join(directory, claimed)
+        with open(claimed, "w") as file:
+            file.write(queued)
+        os.utime(claimed, (0, 0))
+        write_behind.recover()
+        self.assertFalse(os.path.exists(claimed))
+        write_behind.flush()
+        self.assertEqual(Comment.objects.count(), 1)
+
+    def test_recover_leaves_fresh_claims_alone(self):
+        """ Checking a worker start does not requeue a live flush's claims"""
+        self.comment(self.client_auth, "Один раз")
+        paths = write_behind.claim(write_behind.scan(self.reader.pk))
+        write_behind.recover()
+        self.assertEqual(write_behind.scan(), [])
+        write_behind.flush_batch(paths)
+        self.assertEqual(Comment.objects.count(), 1)
+
+
+class TestSearch(TransactionTestCase):
+    """ Author names are indexed on commit, hence the TransactionTestCase"""
+
+    def setUp(self):
+        self.client = Client()
+        self.author = User.objects.create_user(
+            username="Author", first_name="Иван")
+        self.group = Group.objects.create(
+            title="Домашние животные", slug="pets")
+
+    def tearDown(self):
+        clear_caches()
+
+    def search(self, query, **params):
+        response = self.client.get(reverse("search"), {"q": query, **params})
+        return list(response.context["page"])
+
+    def test_stemmed_words_match(self):
+        """ Checking other forms of a word find the post"""
+        post = Post.objects.create(
+            author=self.author, text="Мои красивые котики")
+        self.assertEqual(self.search("красивый котик"), [post])
+        self.assertEqual(self.search("собаки"), [])
+
+    def test_comments_group_and_author_are_indexed(self):
+        post = Post.objects.create(
+            author=self.author, text="Без слов", group=self.group)
+        Comment.objects.create(post=post, author=self.author, text="Ёжики")
+        for query in ("ежик", "животных", "Ивана", "author"):
+            with self.subTest(query):
+                self.assertEqual(self.search(query), [post])
+
+    def test_new_comment_is_appended(self):
+        post = Post.objects.create(author=self.author, text="Без слов")
+        SearchDocument.objects.update(content="старое")
+        Comment.objects.create(post=post, author=self.author, text="Ёжики")
+        self.assertEqual(SearchDocument.objects.get().content, "старое ежик")
+
+    def test_names_are_reindexed_only_when_changed(self):
+        """ Checking saving a user reindexes their posts on a new name"""
+        post = Post.objects.create(author=self.author, text="Без слов")
+        SearchDocument.objects.update(content="старое")
+        author = User.objects.get(pk=self.author.pk)
+        author.save()
+        self.assertEqual(SearchDocument.objects.get().content, "старое")
+        author.first_name = "Пётр"
+        author.save()
+        self.assertEqual(self.search("Петра"), [post])
+        self.assertEqual(self.search("Ивана"), [])
+
+    def test_better_matches_first_and_pages_keep_query(self):
+        weak = Post.objects.create(author=self.author, text="Кошка")
+        strong = Post.objects.create(
+            author=self.author, text="Кошка кошке кошку кошкой")
+        for i in range(10):
+            Post.objects.create(author=self.author, text=f"Кошки {i}")
+        self.assertEqual(self.search("кошка")[0], strong)
+        response = self.client.get(reverse("search"), {"q": "кошка"})
+        self.assertContains(response, "?q=%D0%BA%D0%BE%D1%88%D0%BA%D0%B0&amp;")
+        # The second page is cut from the cached ranking
+        with self.assertNumQueries(1):
+            second = self.search("кошка", page=2)
+        self.assertEqual(len(second), 2)
+        self.assertIn(weak, self.search("кошка") + second)
+
+
+class TestAdmin(TestCase):
+
+    def setUp(self):
+        self.client = Client()
+        self.admin = User.objects.create_superuser(
+            "admin", "admin@example.com", "password")
+        self.client.force_login(self.admin)
+        group = Group.objects.create(title="Группа", slug="group")
+        for i in range(5):
+            post = Post.objects.create(
+                author=self.admin, group=group, text=f"Запись {i}")
+            Comment.objects.create(
+                post=post, author=self.admin, text=f"Комментарий {i}")
+
+    def tearDown(self):
+        clear_caches()
+
+    def queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        """ Checking changelists load related rows in the same query"""
+        for model in ("post", "comment"):
+            url = reverse(f"admin:posts_{model}_changelist")
+            with self.subTest(model):
+                before = self.queries(url)
+                post = Post.objects.create(
+                    author=User.objects.create_user(username=model),
+                    group=Group.objects.create(title=model, slug=model),
+                    text="Ещё одна")
+                Comment.objects.create(post=post, author=post.author)
+                self.assertEqual(self.queries(url), before)
+
+    @override_settings(SEARCH_RESULTS_LIMIT=2)
+    def test_search_finds_every_match(self):
+        """ Checking admin search is neither capped nor cached"""
+        url = reverse("admin:posts_post_changelist")
+        response = self.client.get(url, {"q": "запись"})
+        self.assertEqual(len(response.context["cl"].result_list), 5)
+        Post.objects.create(author=self.admin, text="Новая запись")
+        response = self.client.get(url, {"q": "запись"})
+        self.assertEqual(len(response.context["cl"].result_list), 6)
+        response = self.client.get(url, {"q": "?!"})
+        self.assertEqual(len(response.context["cl"].result_list), 0)
+
+    def test_statistics_estimates(self):
+        """ Checking unusable planner statistics fall back to COUNT(*)"""
+        for value, rows in ((1500000.0, 1500000), ("1500 3", 1500),
+                            (-1.0, None), (None, None), ("", None)):
+            with self.subTest(value=value):
+                self.assertEqual(admin.parse_estimate(value), rows)
+
+    def test_delete_in_batches(self):
+        response = self.client.post(
+            reverse("admin:posts_post_changelist"), {
+                "action": "delete_in_batches",
+                "_selected_action": list(
+                    Post.objects.values_list("pk", flat=True)),
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Post.objects.exists())
+        self.assertEqual(AuthorStats.objects.get(user=self.admin).posts_count,
+                         0)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class TestTransfer(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(username="Author")
+        self.reader = User.objects.create_user(username="Reader")
+        group = Group.objects.create(title="Группа", slug="group")
+        self.post = Post.objects.create(
+            author=self.author, group=group,
+            text="Текст, с запятой\nи строкой",
+            image=SimpleUploadedFile("some.gif", SMALL_GIF, "image/gif"))
+        Post.objects.filter(pk=self.post.pk).update(
+            pub_date="2020-01-02T03:04:05Z")
+        Comment.objects.create(
+            post=self.post, author=self.reader, text="Комментарий")
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        clear_caches()
+
+    def round_trip(self, file_format):
+        out = io.StringIO()
+        call_command("export_content", self.directory, format=file_format,
+                     images=True, stdout=out)
+        image = self.post.image.read()
+        for model in (Follow, Comment, Post, Group, User):
+            model.objects.all().delete()
+        call_command("import_content", self.directory, stdout=out)
+        post = Post.objects.get()
+        self.assertEqual(post.pk, self.post.pk)
+        self.assertEqual(post.text, self.post.text)
+        self.assertEqual(post.pub_date.year, 2020)
+        self.assertEqual(post.group.slug, "group")
+        self.assertEqual(post.image.read(), image)
+        self.assertEqual(post.comment_count, 1)
+        self.assertTrue(Follow.objects.filter(
+            user__username="Reader", author__username="Author").exists())
+        self.assertEqual(
+            AuthorStats.objects.get(user__username="Author").posts_count, 1)
+        self.assertTrue(TimelineEntry.objects.filter(post=post).exists())
+        self.assertTrue(SearchDocument.objects.filter(post=post).exists())
+
+    def test_jsonl_round_trip(self):
+        """ Checking exported content loads back with ids and dates"""
+        self.round_trip("jsonl")
+
+    def test_csv_round_trip(self):
+        self.round_trip("csv")
+
+    def test_import_resumes_from_checkpoint(self):
+        call_command("export_content", self.directory, stdout=io.StringIO())
+        checkpoint = transfer.Checkpoint(self.directory, "import", False)
+        checkpoint.set("posts", 1)
+        checkpoint.set("comments", 1)
+        Post.objects.all().delete()
+        call_command("import_content", self.directory, resume=True,
+                     stdout=io.StringIO())
+        self.assertFalse(Post.objects.exists())
+        self.assertFalse(os.path.exists(checkpoint.path))
+
+    def test_import_skips_rows_whose_ids_are_taken(self):
+        """ Checking comments are not attached to another post with their id"""
+        call_command("export_content", self.directory, stdout=io.StringIO())
+        pk = self.post.pk
+        Post.objects.all().delete()
+        other = Post.objects.create(id=pk, author=self.reader, text="Чужой")
+        out = io.StringIO()
+        call_command("import_content", self.directory, stdout=out)
+        self.assertEqual(Post.objects.get().text, "Чужой")
+        self.assertFalse(other.comments.exists())
+        self.assertIn("Skipped 1 posts", out.getvalue())
+        self.assertIn("Skipped 1 comments", out.getvalue())
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class TestBenchmarks(TestCase):
+
+    def tearDown(self):
+        clear_caches()
+
+    def test_generate_data_and_bench_feeds(self):
+        """ Checking the benchmark fails when a threshold is exceeded"""
+        out = io.StringIO()
+        call_command("generate_data", users=30, posts=100, comments=100,
+                     groups=3, seed=1, stdout=out)
+        self.assertEqual(Post.objects.count(), 100)
+        self.assertTrue(Follow.objects.exists())
+        self.assertTrue(Post.objects.exclude(image="").exists())
+        thresholds = os.path.join(tempfile.mkdtemp(), "thresholds.json")
+        call_command("bench_feeds", requests=2, save=thresholds, stdout=out)
+        with open(thresholds) as file:
+            results = json.load(file)
+        self.assertIn("follow_index", results)
+        self.assertIn("api_comments", results)
+        for name, result in results.items():
+            with self.subTest(name):
+                self.assertEqual(set(result),
+                                 {"p50_ms", "p95_ms", "p99_ms", "queries"})
+                self.assertGreater(result["queries"], 0)
+                self.assertLessEqual(result["p50_ms"], result["p95_ms"])
+                self.assertRegex(out.getvalue(), rf"(?m)^{name} +p50 ")
+        # Timings of a few requests are noise, so only the query counts
+        # are held to the saved run
+        with open(thresholds, "w") as file:
+            json.dump({name: {"queries": result["queries"]}
+                       for name, result in results.items()}, file)
+        call_command("bench_feeds", requests=1, thresholds=thresholds,
+                     stdout=out)
+        self.assertIn("All endpoints within thresholds", out.getvalue())
+        for limits, failure in (({"queries": 0}, "index queries"),
+                                ({"p95_ms": 0}, "index p95_ms")):
+            with open(thresholds, "w") as file:
+                json.dump({"index": limits}, file)
+            with self.assertRaisesRegex(CommandError, failure):
+                call_command("bench_feeds", requests=1,
+                             thresholds=thresholds, stdout=out)
+
+    def test_explain_feeds_compares_plans(self):
+        """ Checking the plans are shown with and without the feed indexes"""
+        out = io.StringIO()
+        call_command("explain_feeds", seed=300, runs=1, compare=True,
+                     stdout=out)
+        output = out.getvalue()
+        with_indexes, without = output.split("== index, without")
+        self.assertIn("post_date_idx", with_indexes)
+        self.assertNotIn("post_date_idx", without)
+        self.assertFalse(Post.objects.exists())
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, Post._meta.db_table)
+        self.assertIn("post_date_idx", constraints)
+
+
+class TestMetrics(TestCase):
+
+    def setUp(self):
+        self.client = Client()
+        self.author = User.objects.create_user(username="Author")
+        Post.objects.create(author=self.author, text="Текст")
+
+    def tearDown(self):
+        clear_caches()
+
+    def test_server_timing(self):
+        """ Checking responses report their queries and cache state"""
+        miss = self.client.get(reverse("index"))["Server-Timing"]
+        self.assertRegex(miss, r'db;dur=[\d.]+;desc="\d+ queries')
+        self.assertIn('cache;desc="miss"', miss)
+        self.assertRegex(miss, r"render;dur=[\d.]+")
+        hit = self.client.get(reverse("index"))["Server-Timing"]
+        self.assertIn('db;dur=0.0;desc="0 queries', hit)
+        self.assertIn('cache;desc="hit"', hit)
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_prometheus_endpoint(self):
+        self.client.get(reverse("profile", args=["Author"]))
+        response = self.client.get(
+            reverse("metrics"), HTTP_AUTHORIZATION="Bearer secret")
+        self.assertContains(
+            response, 'yatube_requests_total{view="profile"}')
+        self.assertContains(
+            response, 'yatube_request_duration_seconds_bucket{view="profile"')
+        for authorization in ("", "Bearer wrong"):
+            with self.subTest(authorization=authorization):
+                # Requests through a proxy on the same host come from there
+                response = Client(REMOTE_ADDR="127.0.0.1").get(
+                    reverse("metrics"), HTTP_AUTHORIZATION=authorization)
+                self.assertEqual(response.status_code, 403)
+
+    @override_settings(METRICS_SLOW_REQUEST_MS=0)
+    def test_slow_requests_are_logged_with_sql(self):
+        with self.assertLogs("yatube.slow_requests", "WARNING") as logs:
+            self.client.get(reverse("profile", args=["Author"]))
+        self.assertIn("posts_post", logs.output[0])
+        self.assertNotIn("'Author'", logs.output[0])
+
+
+class TestApi(TransactionTestCase):
+    """ Caches are invalidated on commit, hence the TransactionTestCase"""
+
+    def setUp(self):
+        self.client = Client()
+        self.author = User.objects.create_user(username="Author")
+        self.reader = User.objects.create_user(username="Reader")
+        self.client.force_login(self.reader)
+        self.group = Group.objects.create(title="Группа", slug="group")
+        self.posts = [
+            Post.objects.create(author=self.author, group=self.group,
+                                text=f"Запись {i}")
+            for i in range(12)
+        ]
+
+    def tearDown(self):
+        clear_caches()
+
+    def test_feeds_with_fields_and_cursor(self):
+        """ Checking feeds return projected fields page by page"""
+        for url in (reverse("api_posts"),
+                    reverse("api_group_posts", args=["group"]),
+                    reverse("api_profile_posts", args=["Author"])):
+            with self.subTest(url):
+                first = self.client.get(url, {"fields": "id,author"}).json()
+                self.assertEqual(first["results"][0],
+                                 {"id": self.posts[-1].pk, "author": "Author"})
+                second = self.client.get(url, {"cursor": first["next"]})
+                ids = [item["id"] for item in first["results"]
+                       + second.json()["results"]]
+                self.assertEqual(
+                    ids, [post.pk for post in reversed(self.posts)])
+        response = self.client.get(reverse("api_posts"), {"fields": "pwd"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_etag_answers_without_queries(self):
+        url = reverse("api_posts")
+        etag = self.client.get(url)["ETag"]
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Post.objects.create(author=self.author, text="Новая")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        post_url = reverse("api_post", args=[self.posts[0].pk])
+        etag = self.client.get(post_url)["ETag"]
+        Comment.objects.create(
+            post=self.posts[0], author=self.reader, text="Текст")
+        response = self.client.get(post_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.json()["comment_count"], 1)
+
+    def test_comments(self):
+        url = reverse("api_comments", args=[self.posts[0].pk])
+        response = self.client.post(
+            url, '{"text": "Комментарий"}', content_type="application/json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["author"], "Reader")
+        self.assertEqual(self.client.get(url).json()["results"][0]["text"],
+                         "Комментарий")
+        self.assertEqual(self.client.post(url, {}).status_code, 400)
+        for body in ("{", "[]", '"Комментарий"'):
+            with self.subTest(body=body):
+                response = self.client.post(
+                    url, body, content_type="application/json")
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(Client().post(url, {"text": "Аноним"}).status_code,
+                         401)
+
+    def test_token_clients_write_without_csrf(self):
+        """ Checking a token authenticates writes that skip the CSRF check"""
+        url = reverse("api_comments", args=[self.posts[0].pk])
+        body = '{"text": "Из приложения"}'
+        key = api.issue_token(self.reader)
+        client = Client(enforce_csrf_checks=True)
+        response = client.post(url, body, content_type="application/json",
+                               HTTP_AUTHORIZATION=f"Token {key}")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["author"], "Reader")
+        response = client.post(url, body, content_type="application/json",
+                               HTTP_AUTHORIZATION="Token wrong")
+        self.assertEqual(response.status_code, 401)
+        client.force_login(self.reader)
+        response = client.post(url, body, content_type="application/json")
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(Comment.objects.count(), 1)
+
+    def test_follow(self):
+        url = reverse("api_follow", args=["Author"])
+        self.assertEqual(self.client.post(url).status_code, 201)
+        feed = self.client.get(reverse("api_follow_posts")).json()
+        self.assertEqual(len(feed["results"]), 10)
+        self.assertEqual(self.client.delete(url).json(), {"following": False})
+        self.assertFalse(Follow.objects.exists())
+
+
+class TestConditionalGet(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(username="Author")
+        self.reader = User.objects.create_user(username="Reader")
+        self.group = Group.objects.create(title="Группа", slug="test")
+        self.post = Post.objects.create(
+            text="Текст", author=self.author, group=self.group)
+        self.urls = (
+            reverse("post", args=[self.author.username, self.post.pk]),
+            reverse("profile", args=[self.author.username]),
+            reverse("group", args=[self.group.slug]),
+        )
+
+    def tearDown(self):
+        clear_caches()
+
+    def etags(self):
+        return [Client().get(url)["ETag"] for url in self.urls]
+
+    def test_unchanged_pages_are_not_rendered(self):
+        """ Checking revalidation answers 304 with a single query"""
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = Client().get(url)
+                self.assertEqual(response.status_code, 200)
+                with self.assertNumQueries(1):
+                    response = Client().get(
+                        url, HTTP_IF_NONE_MATCH=response["ETag"])
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b"")
+                response = Client().get(
+                    url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+                self.assertEqual(response.status_code, 304)
+
+    def test_writes_change_validators(self):
+        """ Checking comments, edits and follows change the ETags"""
+        before = self.etags()
+        Comment.objects.create(post=self.post, author=self.reader, text="Ок")
+        after_comment = self.etags()
+        self.assertTrue(all(map(str.__ne__, before, after_comment)))
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = "Исправленный текст"
+        post.save()
+        after_edit = self.etags()
+        self.assertTrue(all(map(str.__ne__, after_comment, after_edit)))
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertNotEqual(self.etags()[1], after_edit[1])
+
+    def test_viewers_get_their_own_etags(self):
+        url = self.urls[0]
+        anonymous = Client().get(url)
+        client = Client()
+        client.force_login(self.reader)
+        response = client.get(url, HTTP_IF_NONE_MATCH=anonymous["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], anonymous["ETag"])
+
+    def test_cache_headers(self):
+        url = self.urls[1]
+        response = Client().get(url)
+        self.assertIn("Cookie", response["Vary"])
+        self.assertIn("public", response["Cache-Control"])
+        self.assertIn("s-maxage=", response["Cache-Control"])
+        client = Client()
+        client.force_login(self.reader)
+        response = client.get(url)
+        self.assertIn("private", response["Cache-Control"])
+        self.assertIn("no-cache", response["Cache-Control"])
+
+    def test_missing_pages_are_still_404(self):
+        for url in (
+            reverse("post", args=[self.reader.username, self.post.pk]),
+            reverse("profile", args=["Nobody"]),
+        ):
+            with self.subTest(url=url):
+                response = Client().get(url)
+                self.assertEqual(response.status_code, 404)
+                self.assertNotIn("public", response.get("Cache-Control", ""))
+
+    def test_pages_without_validators_are_not_shared(self):
+        """ Checking only pages with validators are left to shared caches"""
+        newcomer = User.objects.create_user(username="Newcomer")
+        self.assertFalse(AuthorStats.objects.filter(user=newcomer).exists())
+        response = Client().get(reverse("profile", args=["Newcomer"]))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("public", response.get("Cache-Control", ""))
+
+
+class TestPageCacheOnFiles(TestPageCache):
+    """ Running the page cache against the file backend every worker
+    process on a host can share
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cache_dir = tempfile.mkdtemp()
+        cls.file_caches = override_settings(CACHES={
+            alias: cache_settings(alias, backend="file",
+                                  location=cls.cache_dir)
+            for alias in settings.CACHE_ALIASES
+        })
+        cls.file_caches.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.file_caches.disable()
+        shutil.rmtree(cls.cache_dir)
+
+    def test_workers_share_cached_pages(self):
+        self.assertIsInstance(caches["pages"], FileBasedCache)
+        url = reverse("index")
+        Client().get(url)
+        pages = caches["pages"]
+        # Overriding CACHES makes Django construct new backend instances,
+        # as another worker process would have
+        with self.settings(CACHES=settings.CACHES):
+            self.assertIsNot(caches["pages"], pages)
+            with self.assertNumQueries(0):
+                Client().get(url)
+
+
+class TestAuthorContextProcessor(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username="Author", first_name="Лев", last_name="Толстой")
+        self.post = Post.objects.create(text="Текст", author=self.author)
+
+    def test_author_is_fetched_once_per_request(self):
+        """ Checking the context processor reuses the view's author"""
+        url = reverse("post", args=[self.author.username, self.post.pk])
+        with CaptureQueriesContext(connection) as queries:
+            response = Client().get(url)
+        self.assertContains(response, "Лев Толстой")
+        lookups = [query["sql"] for query in queries
+                   if '"auth_user"."username" =' in query["sql"]]
+        self.assertEqual(len(lookups), 1)
+
+
 class TestServerResponses(TestCase):
 
     def test_response_404(self):
@@ -0,0 +1,112 @@
+"""Background generation of responsive post image variants.
+
+Posts with an image start with thumbnails_ready=False, which puts them
+in the queue; so does replacing the image. manage.py process_thumbnails
+renders the image at every width in POST_IMAGE_WIDTHS and in every
+format of POST_IMAGE_FORMATS the installed Pillow and sorl-thumbnail can
+write, then flips the flag. Until then the templates show a placeholder
+instead of resizing inside the request.
+
+Images are shared by posts with identical uploads (see storage.py), so
+release() only deletes a file and its thumbnails once unreferenced and
+not touched by an upload for POST_IMAGE_RELEASE_GRACE seconds. A file
+left by that check stays until a later release of the same name.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.utils import timezone
+from PIL import features
+from sorl.thumbnail import delete, get_thumbnail
+from sorl.thumbnail.base import EXTENSIONS
+
+from . import conditional, page_cache
+from .models import Post
+
+MIME_TYPES = {
+    "AVIF": "image/avif",
+    "WEBP": "image/webp",
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+}
+
+
+def formats():
+    """Configured formats that can actually be encoded here"""
+    return [
+        name for name in settings.POST_IMAGE_FORMATS
+        if name in EXTENSIONS and (
+            name in ("JPEG", "PNG") or features.check(name.lower()))
+    ]
+
+
+def variants():
+    """Yield (format, width, geometry, options) of every variant"""
+    ratio_width, ratio_height = settings.POST_IMAGE_ASPECT
+    for name in formats():
+        for width in settings.POST_IMAGE_WIDTHS:
+            height = round(width * ratio_height / ratio_width)
+            yield name, width, f"{width}x{height}", {
+                "crop": "center",
+                "upscale": True,
+                "format": name,
+            }
+
+
+def pending():
+    return Post.objects.filter(thumbnails_ready=False).exclude(
+        image="").exclude(image__isnull=True)
+
+
+def generate(post_id):
+    """Render all variants of the post; return False if it is gone"""
+    post = Post.objects.select_related("author").filter(pk=post_id).first()
+    if post is None or not post.image:
+        return False
+    for _, _, geometry, options in variants():
+        get_thumbnail(post.image, geometry, **options)
+    # The image may have been replaced meanwhile, then it stays queued
+    marked = Post.objects.filter(
+        pk=post.pk, image=post.image.name, thumbnails_ready=False,
+    ).update(thumbnails_ready=True)
+    if marked:
+        post.bump_version()
+        page_cache.forget_post_pages(post)
+        conditional.touch_post_pages(post)
+    return bool(marked)
+
+
+def sources(post):
+    """Return [(mime type, [(url, width), ...]), ...] best format first,
+    or an empty list while the variants are not ready
+    """
+    if not post.image or not post.thumbnails_ready:
+        return []
+    by_format = {}
+    for name, width, geometry, options in variants():
+        image = get_thumbnail(post.image, geometry, **options)
+        by_format.setdefault(name, []).append((image.url, width))
+    return [(MIME_TYPES[name], images) for name, images in by_format.items()]
+
+
+def release(name):
+    """Delete the image and its thumbnails if no post uses it any more"""
+    if not name or Post.objects.filter(image=name).exists():
+        return
+    field = Post._meta.get_field("image")
+    grace = timedelta(seconds=settings.POST_IMAGE_RELEASE_GRACE)
+    try:
+        # The post of a concurrent upload of the same bytes is not
+        # committed yet, but its save() has touched the file
+        if field.storage.get_modified_time(name) > timezone.now() - grace:
+            return
+    except FileNotFoundError:
+        pass
+    except SuspiciousFileOperation:
+        return
+    try:
+        delete(field.attr_class(None, field, name))
+    except SuspiciousFileOperation:
+        # Set by hand to a path outside MEDIA_ROOT, not ours to delete
+        pass
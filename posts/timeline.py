@@ -0,0 +1,114 @@
+"""Materialized subscription feeds.
+
+A new post is written into the timeline of every follower of its author
+(fan-out on write). Authors with at least TIMELINE_FANOUT_LIMIT followers
+are not fanned out: their posts are merged into the feed when it is read.
+When such an author drops below the limit their followers' timelines have
+to be backfilled, as the posts of the popular period were never copied.
+That can be a lot of rows, so the author is only marked and stays merged
+on read until manage.py rebuild_timelines --pending has copied them.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .models import AuthorStats, Follow, Post, TimelineEntry
+
+
+def merged_on_read():
+    return Q(followers_count__gte=settings.TIMELINE_FANOUT_LIMIT) | Q(
+        backfill_pending=True)
+
+
+def is_popular(author_id):
+    return AuthorStats.objects.filter(
+        merged_on_read(), user_id=author_id).exists()
+
+
+def popular_authors(user):
+    """Authors the user follows whose posts are merged on read"""
+    return AuthorStats.objects.filter(
+        merged_on_read(), user__following__user=user).values("user_id")
+
+
+def fan_out(post):
+    if is_popular(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id).values_list("user_id", flat=True)
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post=post) for user_id in followers),
+        ignore_conflicts=True,
+    )
+
+
+def copy_posts(user_ids, author_id):
+    """Copy the author's latest posts into the users' timelines"""
+    post_ids = list(Post.objects.filter(author_id=author_id).values_list(
+        "id", flat=True)[:settings.TIMELINE_BACKFILL_LIMIT])
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post_id=post_id)
+         for user_id in user_ids for post_id in post_ids),
+        ignore_conflicts=True,
+    )
+
+
+def backfill(user_id, author_id):
+    if not is_popular(author_id):
+        copy_posts([user_id], author_id)
+
+
+def follower_lost(author_id):
+    """Mark the author for backfilling once no longer popular"""
+    AuthorStats.objects.filter(
+        user_id=author_id,
+        followers_count=settings.TIMELINE_FANOUT_LIMIT - 1,
+    ).update(backfill_pending=True)
+
+
+@transaction.atomic
+def backfill_followers(author_id):
+    """Copy the author's posts to the followers and stop merging on read"""
+    # The lock holds back new posts of the author, which bump the same row
+    # and would not be fanned out while the author is still marked
+    stats = AuthorStats.objects.select_for_update().filter(
+        user_id=author_id, backfill_pending=True).first()
+    if stats is None:
+        return
+    AuthorStats.objects.filter(user_id=author_id).update(
+        backfill_pending=False)
+    if stats.followers_count >= settings.TIMELINE_FANOUT_LIMIT:
+        # Popular again meanwhile
+        return
+    followers = Follow.objects.filter(
+        author_id=author_id).values_list("user_id", flat=True)
+    copy_posts(list(followers), author_id)
+
+
+def backfill_pending():
+    """Backfill the followers of every marked author; return their number"""
+    author_ids = list(AuthorStats.objects.filter(
+        backfill_pending=True).values_list("user_id", flat=True))
+    for author_id in author_ids:
+        backfill_followers(author_id)
+    return len(author_ids)
+
+
+def prune(user_id, author_id):
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id).delete()
+
+
+@transaction.atomic
+def rebuild(user):
+    TimelineEntry.objects.filter(user=user).delete()
+    authors = Follow.objects.filter(user=user).values_list(
+        "author_id", flat=True)
+    for author_id in authors.distinct():
+        backfill(user.id, author_id)
+
+
+def timeline_posts(user):
+    entries = TimelineEntry.objects.filter(user=user).values("post_id")
+    return Post.objects.filter(
+        Q(id__in=entries) | Q(author_id__in=popular_authors(user)))
@@ -0,0 +1,300 @@
+"""Streaming export and import of site content.
+
+Groups, posts, comments and follows are written one file per model, as
+JSON Lines or CSV, in pk order. Users are referred to by username and
+groups by slug so that the files can be loaded into another database;
+missing users are created without a usable password. Both directions
+work in chunks and record their progress in a checkpoint file, so memory
+stays flat and an interrupted run can be resumed. Rows whose id is taken
+in the target database are skipped and reported, and so are the comments
+of a post that was skipped this way.
+
+bulk_create() skips signals, so after an import the counters, timelines
+and search documents are rebuilt by maintain().
+"""
+import csv
+import itertools
+import json
+import os
+from contextlib import contextmanager
+
+from django.contrib.auth.hashers import make_password
+from django.core.files import File
+from django.core.management import call_command
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils.dateparse import parse_datetime
+
+from . import page_cache
+from .models import Comment, Follow, Group, Post, User
+
+FORMATS = ("jsonl", "csv")
+
+# In load order; the pk column comes first
+MODELS = {
+    "groups": (Group, {
+        "id": "id",
+        "title": "title",
+        "slug": "slug",
+        "description": "description",
+    }),
+    "posts": (Post, {
+        "id": "id",
+        "text": "text",
+        "pub_date": "pub_date",
+        "author": "author__username",
+        "group": "group__slug",
+        "image": "image",
+    }),
+    "comments": (Comment, {
+        "id": "id",
+        "post": "post_id",
+        "author": "author__username",
+        "text": "text",
+        "created": "created",
+    }),
+    "follows": (Follow, {
+        "id": "id",
+        "user": "user__username",
+        "author": "author__username",
+    }),
+}
+
+IMAGES_DIR = "images"
+
+# CSV has no NULL, empty cells of these columns are read as one
+NULLABLE = ("group", "image")
+
+
+def data_path(directory, name, file_format):
+    return os.path.join(directory, f"{name}.{file_format}")
+
+
+def find_format(directory, name):
+    for file_format in FORMATS:
+        if os.path.exists(data_path(directory, name, file_format)):
+            return file_format
+    return None
+
+
+class Checkpoint:
+    """Progress per model kept in a JSON file next to the data"""
+
+    def __init__(self, directory, kind, resume):
+        self.path = os.path.join(directory, f".{kind}-checkpoint.json")
+        self.state = {}
+        if resume and os.path.exists(self.path):
+            with open(self.path) as file:
+                self.state = json.load(file)
+
+    def get(self, name, default=0):
+        return self.state.get(name, default)
+
+    def set(self, name, value):
+        self.state[name] = value
+        with open(self.path + ".tmp", "w") as file:
+            json.dump(self.state, file)
+        os.replace(self.path + ".tmp", self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def export_chunks(name, chunk_size, after=0):
+    """Yield lists of row dicts with pk greater than after"""
+    model, columns = MODELS[name]
+    while True:
+        rows = list(model.objects.filter(pk__gt=after).order_by(
+            "pk").values_list(*columns.values())[:chunk_size])
+        if not rows:
+            return
+        yield [dict(zip(columns, row)) for row in rows]
+        after = rows[-1][0]
+
+
+class Writer:
+
+    def __init__(self, path, name, file_format, append):
+        exists = append and os.path.exists(path)
+        self.file = open(path, "a" if exists else "w", newline="",
+                         encoding="utf-8")
+        self.csv = None
+        if file_format == "csv":
+            self.csv = csv.DictWriter(self.file, fieldnames=MODELS[name][1])
+            if not exists:
+                self.csv.writeheader()
+
+    def write(self, rows):
+        encoder = DjangoJSONEncoder(ensure_ascii=False)
+        for row in rows:
+            if self.csv is None:
+                self.file.write(encoder.encode(row) + "\n")
+            else:
+                self.csv.writerow({
+                    key: "" if value is None else
+                    encoder.default(value) if hasattr(value, "isoformat")
+                    else value
+                    for key, value in row.items()
+                })
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def bundle_images(rows, directory):
+    """Copy the image files of exported posts next to the data"""
+    storage = Post._meta.get_field("image").storage
+    for row in rows:
+        name = row["image"]
+        target = os.path.join(directory, IMAGES_DIR, name or "")
+        if not name or os.path.exists(target) or not storage.exists(name):
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with storage.open(name) as source, open(target, "wb") as copy:
+            for chunk in source.chunks():
+                copy.write(chunk)
+
+
+def read_rows(path, file_format, skip):
+    with open(path, newline="", encoding="utf-8") as file:
+        if file_format == "csv":
+            rows = ({key: None if key in NULLABLE and value == "" else value
+                     for key, value in row.items()}
+                    for row in csv.DictReader(file))
+        else:
+            rows = map(json.loads, file)
+        yield from itertools.islice(rows, skip, None)
+
+
+def chunked(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def user_ids(usernames):
+    """Map usernames to ids, creating the users that do not exist"""
+    usernames = set(usernames)
+    ids = dict(User.objects.filter(
+        username__in=usernames).values_list("username", "pk"))
+    missing = usernames - ids.keys()
+    if missing:
+        User.objects.bulk_create(
+            [User(username=username, password=make_password(None))
+             for username in missing],
+            ignore_conflicts=True,
+        )
+        ids.update(User.objects.filter(
+            username__in=missing).values_list("username", "pk"))
+    return ids
+
+
+def import_image(name, directory):
+    """Store a bundled image and return its name in the storage"""
+    path = os.path.join(directory, IMAGES_DIR, name)
+    if not os.path.exists(path):
+        return name
+    with open(path, "rb") as file:
+        return Post._meta.get_field("image").storage.save(name, File(file))
+
+
+def build(name, rows, directory):
+    """Model instances for a chunk of imported rows"""
+    if name == "groups":
+        return [Group(**row) for row in rows]
+    users = user_ids(
+        row[column] for row in rows for column in ("author", "user")
+        if column in row)
+    if name == "follows":
+        return [Follow(id=row["id"], user_id=users[row["user"]],
+                       author_id=users[row["author"]]) for row in rows]
+    if name == "comments":
+        return [Comment(id=row["id"], post_id=row["post"],
+                        author_id=users[row["author"]], text=row["text"],
+                        created=parse_datetime(row["created"]))
+                for row in rows]
+    groups = dict(Group.objects.filter(
+        slug__in={row["group"] for row in rows if row["group"]},
+    ).values_list("slug", "pk"))
+    return [
+        Post(id=row["id"], text=row["text"],
+             pub_date=parse_datetime(row["pub_date"]),
+             author_id=users[row["author"]],
+             group_id=groups.get(row["group"]),
+             image=row["image"] and import_image(row["image"], directory))
+        for row in rows
+    ]
+
+
+@contextmanager
+def keep_dates():
+    """Let bulk_create() store the exported auto_now_add dates"""
+    fields = [Post._meta.get_field("pub_date"),
+              Comment._meta.get_field("created")]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def clashing_posts(rows):
+    """Ids of the rows that other posts in the database already have"""
+    stored = {
+        pk: (username, pub_date)
+        for pk, username, pub_date in Post.objects.filter(
+            pk__in=[int(row["id"]) for row in rows],
+        ).values_list("pk", "author__username", "pub_date")
+    }
+    # A post of an earlier or interrupted run of this import is no clash
+    return {
+        int(row["id"]) for row in rows if int(row["id"]) in stored
+        and stored[int(row["id"])] != (
+            row["author"], parse_datetime(row["pub_date"]))
+    }
+
+
+def import_chunk(name, rows, directory, clashing=()):
+    """Insert a chunk and return the number of rows skipped.
+
+    Rows whose pk is already taken are skipped, and so are comments of a
+    post that is missing or whose id belongs to another post (see
+    clashing_posts()) rather than being attached to the wrong post.
+    """
+    model = MODELS[name][0]
+    if name == "comments":
+        post_ids = set(Post.objects.filter(
+            pk__in={int(row["post"]) for row in rows},
+        ).values_list("pk", flat=True)) - set(clashing)
+        rows_left = [row for row in rows if int(row["post"]) in post_ids]
+    else:
+        rows_left = rows
+    taken = set(model.objects.filter(
+        pk__in=[int(row["id"]) for row in rows_left],
+    ).values_list("pk", flat=True))
+    rows_left = [row for row in rows_left if int(row["id"]) not in taken]
+    with transaction.atomic(), keep_dates():
+        model.objects.bulk_create(
+            build(name, rows_left, directory), ignore_conflicts=True)
+    return len(rows) - len(rows_left)
+
+
+def maintain(stdout=None):
+    """Rebuild what signals would have maintained for the new rows"""
+    statements = connection.ops.sequence_reset_sql(
+        no_style(), [model for model, _ in MODELS.values()])
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+    call_command("reconcile_counters", stdout=stdout)
+    call_command("rebuild_timelines", stdout=stdout)
+    call_command("rebuild_search_index", missing=True, stdout=stdout)
+    page_cache.bump(page_cache.ALL)
@@ -0,0 +1,86 @@
+"""Bounded handling of uploaded post images.
+
+Uploads are streamed to a temporary file and cut off once they pass
+POST_IMAGE_MAX_BYTES, so a huge body never reaches Pillow. Images are
+checked from their headers before any pixel data is decoded and then
+re-encoded without EXIF, shrunk to POST_IMAGE_MAX_SIDE on the way.
+"""
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from PIL import Image, ImageOps
+
+FORMATS = ("JPEG", "PNG", "GIF", "WEBP")
+
+# Only the first frame of a GIF is kept, a still image is better off as PNG
+OUTPUT_FORMATS = {"GIF": "PNG"}
+
+EXTENSIONS = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp"}
+
+
+class TooLarge(Exception):
+    pass
+
+
+class LimitedTemporaryFileUploadHandler(TemporaryFileUploadHandler):
+    """Stop writing a file to disk once it passes POST_IMAGE_MAX_BYTES.
+
+    The truncated file is still returned, marked as oversized, so that
+    the form can tell the user what went wrong.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received <= settings.POST_IMAGE_MAX_BYTES:
+            self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.oversized = self.received > settings.POST_IMAGE_MAX_BYTES
+        if file.oversized:
+            file.file.truncate(0)
+        return file
+
+
+def sanitize(upload):
+    """Return a re-encoded copy of the uploaded image without metadata.
+
+    Raise TooLarge if its header declares more than POST_IMAGE_MAX_PIXELS
+    and ValueError for formats the site does not accept.
+    """
+    upload.seek(0)
+    with Image.open(upload) as image:
+        # Only the header is read so far
+        kind = image.format
+        if kind not in FORMATS:
+            raise ValueError(kind)
+        width, height = image.size
+        if width * height > settings.POST_IMAGE_MAX_PIXELS:
+            raise TooLarge(width * height)
+        options = {"format": OUTPUT_FORMATS.get(kind, kind)}
+        if "icc_profile" in image.info:
+            options["icc_profile"] = image.info["icc_profile"]
+        # JPEGs are decoded straight at a reduced scale (see Image.draft)
+        side = settings.POST_IMAGE_MAX_SIDE
+        image.thumbnail((side, side))
+        image = ImageOps.exif_transpose(image)
+    if image.mode == "LA" or "transparency" in image.info:
+        # Palette transparency trips up sorl-thumbnail's JPEG output
+        image = image.convert("RGBA")
+    elif image.mode not in ("RGB", "L", "RGBA"):
+        image = image.convert("RGB")
+    # Saved without exif=, so the metadata stays behind
+    clean = File(
+        tempfile.SpooledTemporaryFile(settings.FILE_UPLOAD_MAX_MEMORY_SIZE),
+        os.path.splitext(upload.name)[0] + EXTENSIONS[options["format"]],
+    )
+    image.save(clean, **options)
+    clean.seek(0)
+    return clean
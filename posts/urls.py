@@ -15,6 +15,9 @@ urlpatterns = [
     path("follow/",
          views.follow_index,
          name="follow_index"),
+    path("search/",
+         views.search,
+         name="search"),
     path("<str:username>/",
          views.profile,
          name="profile"),
@@ -24,6 +27,9 @@ urlpatterns = [
     path("<str:username>/<int:post_id>/edit/",
          views.post_edit,
          name="post_edit"),
+    path("<str:username>/<int:post_id>/comments/",
+         views.post_comments,
+         name="post_comments"),
     path("<str:username>/<int:post_id>/comment",
          views.add_comment,
          name="add_comment"),
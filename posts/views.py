@@ -1,30 +1,57 @@
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
+from django.db import transaction
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
 
+from . import comments, write_behind
+from .conditional import (
+    conditional, group_validators, post_validators, profile_validators)
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post, User
+from .models import AuthorStats, Follow, Group, Post, User
+from .page_cache import cached_page
+from .paginator import POSTS_PER_PAGE, paginate
+from .search import ranked_ids
+from .timeline import timeline_posts
 
 
-@cache_page(1 * 20, key_prefix="index_page")
+def get_author(request, username):
+    """Fetch the author named in the URL and remember it for the request"""
+    request.url_author = get_object_or_404(User, username=username)
+    return request.url_author
+
+
+@cached_page("index")
 def index(request):
-    post_list = Post.objects.all()[:]
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    post_list = Post.objects.for_feed()
+    paginator, page = paginate(request, post_list, "index")
+    comments.attach_latest(page.object_list)
     return render(request, "index.html", {
         "page": page,
         "paginator": paginator,
+        "comment_form": CommentForm(),
+    })
+
+
+def search(request):
+    query = request.GET.get("q", "").strip()
+    paginator = Paginator(ranked_ids(query) if query else [], POSTS_PER_PAGE)
+    page = paginator.get_page(request.GET.get("page"))
+    posts = Post.objects.for_feed().in_bulk(page.object_list)
+    page.object_list = [
+        posts[pk] for pk in page.object_list if pk in posts]
+    return render(request, "search.html", {
+        "query": query,
+        "page": page,
+        "paginator": paginator,
     })
 
 
+@conditional(group_validators)
+@cached_page("group:{slug}")
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    posts = group.posts.for_feed()
+    paginator, page = paginate(request, posts, "group")
     return render(request, "group.html", {
         "group": group,
         "page": page,
@@ -33,6 +60,7 @@ def group_posts(request, slug):
 
 
 @login_required
+@transaction.atomic
 def new_post(request):
     form = PostForm(
         request.POST or None,
@@ -48,30 +76,56 @@ def new_post(request):
     return redirect("index")
 
 
+@conditional(profile_validators)
+@cached_page("profile:{username}")
 def profile(request, username):
-    user = get_object_or_404(User, username=username)
-    posts = user.posts.all()
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    user = get_author(request, username)
+    posts = user.posts.for_feed()
+    paginator, page = paginate(request, posts, "profile")
     return render(request, "profile.html", {
         "page": page,
         "paginator": paginator,
         "author": user,
+        "stats": AuthorStats.objects.for_user(user),
     })
 
 
+@conditional(post_validators)
+@cached_page("profile:{username}")
 def post_view(request, username, post_id):
-    user = get_object_or_404(User, username=username)
-    post = get_object_or_404(Post, author=user, id=post_id)
+    user = get_author(request, username)
+    post = get_object_or_404(
+        Post.objects.for_feed(),
+        author=user,
+        id=post_id,
+    )
+    first_comments, cursor = comments.first_page(post)
     comment_form = CommentForm()
     return render(request, "post.html", {
         "post": post,
         "author": user,
+        "comments": first_comments,
+        "comments_cursor": cursor,
         "comment_form": comment_form,
     })
 
 
+@cached_page("profile:{username}")
+def post_comments(request, username, post_id):
+    """The next page of a post's comments, for "load more" links"""
+    post = get_object_or_404(
+        Post.objects.select_related("author"),
+        author__username=username,
+        id=post_id,
+    )
+    page = comments.paginator(post).get_page(request.GET.get("cursor"))
+    return render(request, "includes/comment_list.html", {
+        "post": post,
+        "comments": page,
+        "cursor": page.next_cursor,
+    })
+
+
 def post_edit(request, username, post_id):
     post = get_object_or_404(Post, id=post_id)
     if post.author != request.user:
@@ -91,8 +145,9 @@ def post_edit(request, username, post_id):
 
 
 @login_required
+@transaction.atomic
 def add_comment(request, username, post_id):
-    user = get_object_or_404(User, username=username)
+    user = get_author(request, username)
     post = get_object_or_404(Post, author=user, id=post_id)
     form = CommentForm(request.POST or None)
     if not form.is_valid():
@@ -100,6 +155,9 @@ def add_comment(request, username, post_id):
             "form": form,
             "post": post
         })
+    if write_behind.enabled():
+        write_behind.add_comment(request.user, post, form.cleaned_data["text"])
+        return redirect("post", username=username, post_id=post_id)
     comment = form.save(commit=False)
     comment.author = request.user
     comment.post = post
@@ -122,11 +180,11 @@ def server_error(request):
 
 @login_required
 def follow_index(request):
-    posts = Post.objects.filter(
-        author__following__user=request.user).all()
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    if write_behind.enabled():
+        # The feed is built from follows, the viewer's own must be there
+        write_behind.flush(request.user.pk)
+    posts = timeline_posts(request.user).for_feed()
+    paginator, page = paginate(request, posts, "follow_index")
     return render(request, "follow.html", {
         "page": page,
         "paginator": paginator,
@@ -135,16 +193,25 @@ def follow_index(request):
 
 
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
-    if request.user != author:
+    if request.user == author:
+        return redirect("profile", username=username)
+    if write_behind.enabled():
+        write_behind.follow(request.user, author)
+    else:
         Follow.objects.get_or_create(user=request.user, author=author)
     return redirect("profile", username=username)
 
 
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
+    if write_behind.enabled():
+        write_behind.unfollow(request.user, author)
+        return redirect("profile", username=username)
     follow_to_delete = get_object_or_404(Follow, user=request.user,
                                          author=author)
     follow_to_delete.delete()
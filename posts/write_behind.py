@@ -0,0 +1,243 @@
+"""Optional write-behind queue for comments and follows.
+
+With WRITE_BEHIND_DIR set, add_comment, profile_follow and
+profile_unfollow do not write to the database. They drop a small JSON
+file into <WRITE_BEHIND_DIR>/<user id>/ and answer at once. manage.py
+flush_writes inserts the queued rows in batches, one transaction and one
+bulk_create per batch, and then does what the signals would have done
+for each row. Bursts of writes then take the database lock once per
+batch instead of once per request, which is what makes SQLite give up
+with "database is locked".
+
+Until their writes are flushed, users see them anyway: the comment form
+lists the viewer's queued comments, the follow button honours queued
+follows and unfollows, and the subscription feed flushes the viewer's
+own queue first.
+
+A flush claims the files it works on by renaming them, so that the
+worker and a request flushing its viewer's queue never insert the same
+write twice. Claims left by a crash are put back by recover(); every
+write has an id that is stored with its comment, so comments of a batch
+that was committed before the crash are not inserted again.
+"""
+import json
+import os
+import time
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from . import signals
+from .models import Comment, Follow, Post, User
+
+QUEUED = ".json"
+
+CLAIMED = ".json.flushing"
+
+COMMENT = "comment"
+FOLLOW = "follow"
+UNFOLLOW = "unfollow"
+
+
+def enabled():
+    return bool(settings.WRITE_BEHIND_DIR)
+
+
+def user_dir(user_id):
+    return os.path.join(settings.WRITE_BEHIND_DIR, str(user_id))
+
+
+def enqueue(kind, user_id, **fields):
+    """Queue a write; the name sorts the queue by arrival"""
+    directory = user_dir(user_id)
+    os.makedirs(directory, exist_ok=True)
+    write_id = uuid.uuid4().hex
+    name = f"{time.time_ns():020d}-{write_id}.json"
+    temporary = os.path.join(directory, "." + name)
+    with open(temporary, "w") as file:
+        json.dump({
+            "id": write_id,
+            "kind": kind,
+            "user_id": user_id,
+            "queued": time.time(),
+            **fields,
+        }, file)
+    # Readers only pick up complete files
+    os.replace(temporary, os.path.join(directory, name))
+
+
+def add_comment(user, post, text):
+    enqueue(COMMENT, user.pk, post_id=post.pk, text=text)
+
+
+def follow(user, author):
+    enqueue(FOLLOW, user.pk, author_id=author.pk)
+
+
+def unfollow(user, author):
+    enqueue(UNFOLLOW, user.pk, author_id=author.pk)
+
+
+def scan(user_id=None, suffix=QUEUED):
+    """Paths of queued writes with the suffix, oldest first"""
+    if user_id is not None:
+        directories = [user_dir(user_id)]
+    else:
+        root = settings.WRITE_BEHIND_DIR
+        directories = [entry.path for entry in os.scandir(root)
+                       if entry.is_dir()] if os.path.isdir(root) else []
+    paths = []
+    for directory in directories:
+        if os.path.isdir(directory):
+            paths += [entry.path for entry in os.scandir(directory)
+                      if entry.name.endswith(suffix)
+                      and not entry.name.startswith(".")]
+    return sorted(paths, key=os.path.basename)
+
+
+def claim(paths):
+    """Rename the files to claimed ones; skip those somebody else took"""
+    claimed = []
+    for path in paths:
+        try:
+            os.rename(path, path[:-len(QUEUED)] + CLAIMED)
+        except FileNotFoundError:
+            continue
+        claimed.append(path[:-len(QUEUED)] + CLAIMED)
+        # The modification time tells recover() when it was claimed
+        os.utime(claimed[-1])
+    return claimed
+
+
+def recover():
+    """Queue the claims of a flush that did not finish again.
+
+    Claims younger than WRITE_BEHIND_CLAIM_TIMEOUT are left alone, as a
+    request may be flushing them right now.
+    """
+    stale = time.time() - settings.WRITE_BEHIND_CLAIM_TIMEOUT
+    for path in scan(suffix=CLAIMED):
+        try:
+            if os.path.getmtime(path) < stale:
+                os.replace(path, path[:-len(CLAIMED)] + QUEUED)
+        except FileNotFoundError:
+            # Its flush finished meanwhile
+            continue
+
+
+def read(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def pending(request):
+    """The viewer's queued writes, read once per request"""
+    if request is None:
+        return []
+    if not hasattr(request, "pending_writes"):
+        request.pending_writes = []
+        if enabled() and request.user.is_authenticated:
+            paths = scan(request.user.pk, CLAIMED) + scan(request.user.pk)
+            entries = []
+            for path in paths:
+                try:
+                    entries.append(read(path))
+                except FileNotFoundError:
+                    # Flushed meanwhile, so it is in the database now
+                    continue
+            request.pending_writes = sorted(
+                entries, key=lambda entry: entry["queued"])
+    return request.pending_writes
+
+
+def pending_comments(request, post_id):
+    return [entry for entry in pending(request)
+            if entry["kind"] == COMMENT and entry["post_id"] == post_id]
+
+
+def pending_follow(request, author_id):
+    """True or False for a queued (un)follow of the author, else None"""
+    state = None
+    for entry in pending(request):
+        if entry["kind"] != COMMENT and entry["author_id"] == author_id:
+            state = entry["kind"] == FOLLOW
+    return state
+
+
+def insert_comments(entries):
+    if not entries:
+        return
+    post_ids = set(Post.objects.filter(
+        pk__in={entry["post_id"] for entry in entries},
+    ).values_list("pk", flat=True))
+    # Rows of a batch that was committed but not removed from the queue
+    stored = set(Comment.objects.filter(
+        write_id__in=[uuid.UUID(entry["id"]) for entry in entries],
+    ).values_list("write_id", flat=True))
+    comments = [
+        Comment(post_id=entry["post_id"], author_id=entry["user_id"],
+                text=entry["text"], write_id=uuid.UUID(entry["id"]))
+        for entry in entries
+        if entry["post_id"] in post_ids
+        and uuid.UUID(entry["id"]) not in stored
+    ]
+    Comment.objects.bulk_create(comments)
+    texts = defaultdict(list)
+    for comment in comments:
+        texts[comment.post_id].append(comment.text)
+    for post_id, post_texts in texts.items():
+        signals.comments_added(post_id, post_texts)
+
+
+def apply_follows(entries):
+    # The last queued action on a pair wins
+    wanted = {}
+    for entry in entries:
+        pair = entry["user_id"], entry["author_id"]
+        wanted[pair] = entry["kind"] == FOLLOW
+    if not wanted:
+        return
+    user_ids = {user_id for pair in wanted for user_id in pair}
+    existing_users = set(User.objects.filter(
+        pk__in=user_ids).values_list("pk", flat=True))
+    existing = set(Follow.objects.filter(
+        user_id__in=user_ids, author_id__in=user_ids,
+    ).values_list("user_id", "author_id"))
+    for (user_id, author_id), follows in wanted.items():
+        if (follows and (user_id, author_id) not in existing
+                and user_id != author_id
+                and {user_id, author_id} <= existing_users):
+            # One by one: post_save (counters, timeline backfill) must only
+            # be sent for rows this batch inserted, not for concurrent ones
+            Follow.objects.get_or_create(user_id=user_id, author_id=author_id)
+    removed = Q()
+    for (user_id, author_id), follows in wanted.items():
+        if not follows and (user_id, author_id) in existing:
+            removed |= Q(user_id=user_id, author_id=author_id)
+    if removed:
+        # Sends post_delete for every row
+        Follow.objects.filter(removed).delete()
+
+
+@transaction.atomic
+def flush_batch(paths):
+    entries = [read(path) for path in paths]
+    insert_comments([e for e in entries if e["kind"] == COMMENT])
+    apply_follows([e for e in entries if e["kind"] != COMMENT])
+    transaction.on_commit(lambda: [os.remove(path) for path in paths])
+
+
+def flush(user_id=None, batch_size=None):
+    """Write the queue to the database; return the number of writes"""
+    batch_size = batch_size or settings.WRITE_BEHIND_BATCH_SIZE
+    paths = scan(user_id)
+    flushed = 0
+    for start in range(0, len(paths), batch_size):
+        claimed = claim(paths[start:start + batch_size])
+        if claimed:
+            flush_batch(claimed)
+        flushed += len(claimed)
+    return flushed
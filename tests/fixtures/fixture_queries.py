@@ -0,0 +1,63 @@
+import json
+import os
+
+import pytest
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+BUDGETS_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), 'query_budgets.json')
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        '--update-query-budgets',
+        action='store_true',
+        help=f'Rewrite {os.path.basename(BUDGETS_FILE)} with the query '
+             'counts of this run instead of checking them',
+    )
+
+
+class QueryBudgets:
+    """Query counts per view, checked against the stored baseline"""
+
+    def __init__(self, budgets, update):
+        self.budgets = budgets
+        self.update = update
+        self.recorded = {}
+
+    def count(self, client, method, url, data=None):
+        """Request the page with cold caches and count its queries"""
+        for alias in settings.CACHES:
+            if alias != settings.SESSION_CACHE_ALIAS:
+                caches[alias].clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(client, method)(url, data or {})
+        return response, len(queries)
+
+    def check(self, name, count):
+        if self.update:
+            self.recorded[name] = max(count, self.recorded.get(name, 0))
+            return
+        assert name in self.budgets, \
+            f'Нет бюджета запросов для `{name}`, запустите pytest --update-query-budgets'
+        assert count <= self.budgets[name], \
+            f'`{name}` делает {count} запросов к базе, бюджет {self.budgets[name]}'
+
+
+@pytest.fixture(scope='session')
+def query_budgets(request):
+    budgets = {}
+    if os.path.exists(BUDGETS_FILE):
+        with open(BUDGETS_FILE) as file:
+            budgets = json.load(file)
+    update = request.config.getoption('--update-query-budgets')
+    tracker = QueryBudgets(budgets, update)
+    yield tracker
+    if update and tracker.recorded:
+        with open(BUDGETS_FILE, 'w') as file:
+            json.dump({**budgets, **tracker.recorded}, file, indent=2,
+                      sort_keys=True)
+            file.write('\n')
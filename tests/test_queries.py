@@ -0,0 +1,98 @@
+import pytest
+from django.urls import reverse
+
+from posts import urls as posts_urls
+
+# How each named URL of posts.urls is requested: method, URL and data
+VIEWS = {
+    'index': lambda d: ('get', reverse('index'), None),
+    'group': lambda d: ('get', reverse('group', args=[d['group'].slug]), None),
+    'new_post': lambda d: ('get', reverse('new_post'), None),
+    'follow_index': lambda d: ('get', reverse('follow_index'), None),
+    'search': lambda d: ('get', reverse('search'), {'q': 'пост'}),
+    'profile': lambda d: (
+        'get', reverse('profile', args=[d['author'].username]), None),
+    'post': lambda d: (
+        'get', reverse('post', args=[d['author'].username, d['post'].id]),
+        None),
+    'post_comments': lambda d: (
+        'get', reverse('post_comments', args=[d['author'].username,
+                                              d['post'].id]), None),
+    'post_edit': lambda d: (
+        'get', reverse('post_edit', args=[d['user'].username,
+                                          d['own_post'].id]), None),
+    'add_comment': lambda d: (
+        'post', reverse('add_comment', args=[d['author'].username,
+                                             d['post'].id]),
+        {'text': 'Комментарий'}),
+    'profile_follow': lambda d: (
+        'get', reverse('profile_follow', args=[d['other'].username]), None),
+    'profile_unfollow': lambda d: (
+        'get', reverse('profile_unfollow', args=[d['author'].username]),
+        None),
+}
+
+# Views listing posts or comments, their queries must not grow with size
+LISTS = ('index', 'group', 'follow_index', 'search', 'profile', 'post',
+         'post_comments')
+
+
+def populate(user, size):
+    from django.contrib.auth import get_user_model
+    from posts.models import Comment, Follow, Group, Post
+    User = get_user_model()
+    author = User.objects.create_user(username='QueryAuthor')
+    other = User.objects.create_user(username='QueryOther')
+    group = Group.objects.create(title='Группа', slug='queries')
+    Follow.objects.create(user=user, author=author)
+    posts = [
+        Post.objects.create(text=f'Тестовый пост {i}', author=author,
+                            group=group)
+        for i in range(size)
+    ]
+    for post in posts:
+        for commenter in (user, other):
+            Comment.objects.create(post=post, author=commenter, text='Текст')
+    own_post = Post.objects.create(text='Свой пост', author=user, group=group)
+    return {'user': user, 'author': author, 'other': other, 'group': group,
+            'post': posts[0], 'own_post': own_post}
+
+
+class TestQueryBudgets:
+
+    def test_every_view_has_a_budget_spec(self):
+        names = {pattern.name for pattern in posts_urls.urlpatterns}
+        missing = names - set(VIEWS)
+        assert not missing, \
+            f'Опишите запрос к {sorted(missing)} в tests/test_queries.py'
+
+    @pytest.mark.django_db(transaction=True)
+    @pytest.mark.parametrize('name', sorted(VIEWS))
+    def test_view_within_budget(self, name, user, user_client, query_budgets):
+        data = populate(user, 10)
+        method, url, params = VIEWS[name](data)
+        response, count = query_budgets.count(user_client, method, url, params)
+        assert response.status_code in (200, 301, 302), \
+            f'`{name}` вернул код {response.status_code}'
+        query_budgets.check(name, count)
+
+    @pytest.mark.django_db(transaction=True)
+    @pytest.mark.parametrize('name', LISTS)
+    def test_queries_do_not_grow_with_page_size(self, name, user, user_client,
+                                                query_budgets):
+        from posts.models import Comment, Post
+        data = populate(user, 1)
+        method, url, params = VIEWS[name](data)
+        _, small = query_budgets.count(user_client, method, url, params)
+        for i in range(9):
+            post = Post.objects.create(text=f'Тестовый пост ещё {i}',
+                                       author=data['author'],
+                                       group=data['group'])
+            Comment.objects.create(post=post, author=data['other'],
+                                   text='Текст')
+        for _ in range(9):
+            Comment.objects.create(post=data['post'], author=data['other'],
+                                   text='Ещё текст')
+        _, large = query_budgets.count(user_client, method, url, params)
+        assert large == small, \
+            f'Число запросов `{name}` растёт с числом записей: {small} -> {large}'
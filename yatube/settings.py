@@ -48,6 +48,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'posts.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -62,7 +63,8 @@ ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that report render time to posts.metrics
+        'BACKEND': 'posts.metrics.Templates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -145,8 +147,143 @@ MEDIA_URL = '/media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+# Uploads stream to a temporary file and stop being stored past
+# POST_IMAGE_MAX_BYTES. Larger pictures are rejected from their headers,
+# the rest are re-encoded without EXIF at most POST_IMAGE_MAX_SIDE wide.
+FILE_UPLOAD_HANDLERS = ["posts.uploads.LimitedTemporaryFileUploadHandler"]
+
+POST_IMAGE_MAX_BYTES = 10 * 2 ** 20
+
+POST_IMAGE_MAX_PIXELS = 40_000_000
+
+POST_IMAGE_MAX_SIDE = 2880
+
+# The cache backend is chosen with YATUBE_CACHE_BACKEND:
+#   locmem    - per process, the default for development and tests
+#   file      - a directory shared by all workers on one host
+#   memcached - needs python-memcached
+#   redis     - needs django-redis
+# YATUBE_CACHE_LOCATION overrides the directory or server address.
+# Every named cache below gets its own location or key prefix.
+CACHE_BACKENDS = {
+    "locmem": ("django.core.cache.backends.locmem.LocMemCache", ""),
+    "file": (
+        "django.core.cache.backends.filebased.FileBasedCache",
+        os.path.join(BASE_DIR, "cache"),
+    ),
+    "memcached": (
+        "django.core.cache.backends.memcached.MemcachedCache",
+        "127.0.0.1:11211",
+    ),
+    "redis": ("django_redis.cache.RedisCache", "redis://127.0.0.1:6379/1"),
 }
+
+CACHE_BACKEND = os.environ.get("YATUBE_CACHE_BACKEND", "locmem")
+
+
+def cache_settings(alias, backend=CACHE_BACKEND, location=None):
+    engine, default_location = CACHE_BACKENDS[backend]
+    location = location or os.environ.get(
+        "YATUBE_CACHE_LOCATION", default_location)
+    if backend == "locmem":
+        location = alias
+    elif backend == "file":
+        location = os.path.join(location, alias)
+    return {
+        "BACKEND": engine,
+        "LOCATION": location,
+        "KEY_PREFIX": alias,
+    }
+
+
+# default - small shared values (follow sets, page versions)
+# pages - whole feed pages, fragments - rendered post cards,
+# sessions - cached_db sessions, thumbnails - sorl-thumbnail key-value store
+CACHE_ALIASES = ("default", "pages", "fragments", "sessions", "thumbnails")
+
+CACHES = {alias: cache_settings(alias) for alias in CACHE_ALIASES}
+
+SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
+
+SESSION_CACHE_ALIAS = "sessions"
+
+THUMBNAIL_CACHE = "thumbnails"
+
+# Feeds listed here are paginated with opaque ?cursor= tokens instead of
+# ?page=N. Old ?page=N links keep working for the first few pages.
+POSTS_CURSOR_PAGINATION = ()
+
+POSTS_CURSOR_COMPAT_PAGES = 5
+
+# Post pages show this many newest comments and load more in pages of the
+# same size, the index shows FEED_COMMENTS under every post.
+COMMENTS_PER_PAGE = 20
+
+FEED_COMMENTS = 3
+
+# Authors with this many followers are merged into subscription feeds on
+# read instead of being copied into every follower's timeline. Authors who
+# drop below it stay merged until manage.py rebuild_timelines --pending
+# (run it periodically) has backfilled their followers.
+TIMELINE_FANOUT_LIMIT = 1000
+
+TIMELINE_BACKFILL_LIMIT = 500
+
+# Seconds a viewer's set of followed authors stays cached, and the largest
+# set worth caching (bigger ones are checked with an EXISTS query).
+FOLLOW_CACHE_TIMEOUT = 60
+
+FOLLOW_SET_LIMIT = 1000
+
+# Feed pages stay cached until a write invalidates them; the timeout only
+# bounds memory. While a page is being re-rendered for this many seconds
+# other requests are served its previous copy.
+PAGE_CACHE_TIMEOUT = 60 * 60
+
+PAGE_CACHE_LOCK_TIMEOUT = 10
+
+# Post, profile and group pages carry an ETag and Last-Modified and are
+# answered with 304 while unchanged. Browsers revalidate every time,
+# shared caches may keep a copy of what anonymous visitors see this long.
+CONDITIONAL_SHARED_MAX_AGE = 60
+
+# Search keeps the ids of this many best matches of a query for
+# SEARCH_CACHE_TIMEOUT seconds, pages are cut from that list.
+SEARCH_RESULTS_LIMIT = 500
+
+SEARCH_CACHE_TIMEOUT = 300
+
+# Requests slower than this are logged to "yatube.slow_requests" with
+# their SQL. /metrics/ is open to staff and to scrapers sending
+# "Authorization: Bearer <METRICS_TOKEN>"; without a token only to staff.
+METRICS_SLOW_REQUEST_MS = 500
+
+METRICS_TOKEN = os.environ.get("YATUBE_METRICS_TOKEN")
+
+# Variants rendered for every post image by manage.py process_thumbnails:
+# each width of the POST_IMAGE_ASPECT crop in each format, best first.
+# Formats the installed Pillow or sorl-thumbnail cannot write (AVIF as of
+# sorl-thumbnail 12.6) are skipped; the last one is the <img> fallback.
+POST_IMAGE_ASPECT = (960, 339)
+
+POST_IMAGE_WIDTHS = (480, 960, 1440)
+
+POST_IMAGE_FORMATS = ("AVIF", "WEBP", "JPEG")
+
+THUMBNAIL_POLL_INTERVAL = 2
+
+# An unreferenced image written or reused by an upload within this many
+# seconds is not deleted: the post using it may not be committed yet.
+POST_IMAGE_RELEASE_GRACE = 600
+
+# With a directory set (YATUBE_WRITE_BEHIND_DIR), comments and follows are
+# queued there and written in batches by manage.py flush_writes --loop.
+WRITE_BEHIND_DIR = os.environ.get("YATUBE_WRITE_BEHIND_DIR")
+
+WRITE_BEHIND_BATCH_SIZE = 500
+
+WRITE_BEHIND_POLL_INTERVAL = 1
+
+# Claimed writes older than this many seconds belong to a flush that died
+# and are queued again; younger ones may still be in a live flush.
+WRITE_BEHIND_CLAIM_TIMEOUT = 300
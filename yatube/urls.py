@@ -5,6 +5,8 @@ from django.contrib import admin
 from django.contrib.flatpages import views
 from django.urls import include, path
 
+from posts.metrics import metrics_view
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("about/", include("django.contrib.flatpages.urls")),
@@ -15,6 +17,8 @@ urlpatterns = [
     path("about-spec/", views.flatpage, name="spec"),
     path("about-us/", views.flatpage, {"url": "/about-us/"}, name="about"),
     path("terms/", views.flatpage, {"url": "/terms/"}, name="terms"),
+    path("metrics/", metrics_view, name="metrics"),
+    path("api/v1/", include("posts.api_urls")),
     path("", include("posts.urls")),
 ]
 